@@ -1,10 +1,11 @@
+import asyncio
 import json
 import os
-from typing import Callable, Awaitable
+from typing import Awaitable, Callable, List, Optional
 
 import aio_pika
-import pika
 from aio_pika import Message, connect_robust
+from aio_pika.pool import Pool
 from dotenv import load_dotenv
 from faststream import FastStream
 from faststream.rabbit import RabbitBroker
@@ -21,17 +22,39 @@ app = FastStream(broker)
 
 _is_connected = False
 
+# Сколько сообщений может ждать подтверждения брокера одновременно; дальше publish ждет
+RABBITMQ_MAX_IN_FLIGHT = int(os.getenv("RABBITMQ_MAX_IN_FLIGHT", "256"))
+# Каналы для публикации: параллельные запросы публикуют каждый в своем
+RABBITMQ_CHANNEL_POOL_SIZE = int(os.getenv("RABBITMQ_CHANNEL_POOL_SIZE", "8"))
+# Очереди, которые объявляются при подключении и после переподключения
+TOPOLOGY_QUEUES = ("orders", "notifications")
+# Изменения каталога мимо API (остатки списывает бот); fanout - сообщение получает каждый воркер
+CATALOG_CHANGES_EXCHANGE = "catalog_changes"
+
 class AsyncRabbitMQClient:
-    def __init__(self):
+    def __init__(self, max_in_flight: int = RABBITMQ_MAX_IN_FLIGHT, channel_pool_size: int = RABBITMQ_CHANNEL_POOL_SIZE):
         self.url = os.getenv("RABBITMQ_URL")
         self.connection = None
+        # Канал для consume и объявления очередей
         self.channel = None
+        # Пул каналов для публикации
+        self.channels: Optional[Pool] = None
+        self.channel_pool_size = channel_pool_size
+        self.max_in_flight = max_in_flight
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        # Уже объявленные очереди: повторно declare_queue не шлем
+        self._declared = set()
 
     async def connect(self):
         """Асинхронное подключение к RabbitMQ"""
         try:
             self.connection = await connect_robust(self.url, reconnect_interval=5)
             self.channel = await self.connection.channel()
+            self.channels = Pool(self._open_channel, max_size=self.channel_pool_size)
+            self._declared.clear()
+            await self.declare_topology()
+            # Брокер мог потерять очереди вместе с узлом - объявляем заново
+            self.connection.reconnect_callbacks.add(self._on_reconnect)
             print("✅ RabbitMQ connected (async)")
             return True
         except Exception as e:
@@ -40,36 +63,63 @@ class AsyncRabbitMQClient:
 
     async def close(self):
         """Асинхронное закрытие подключения"""
+        if self.channels:
+            await self.channels.close()
+            self.channels = None
         if self.connection:
             await self.connection.close()
             print("✅ RabbitMQ disconnected (async)")
 
-    async def publish(self, queue: str, message: dict):
-        """Асинхронная публикация сообщения"""
+    async def _open_channel(self):
+        # С подтверждениями publish завершается, только когда брокер принял сообщение
+        return await self.connection.channel(publisher_confirms=True)
+
+    async def declare_topology(self):
+        """Объявляет известные очереди один раз; дальше publish их не объявляет"""
+        for queue in sorted(set(TOPOLOGY_QUEUES) | self._declared):
+            self._declared.discard(queue)
+            await self._declare(self.channel, queue)
+
+    async def _on_reconnect(self, connection):
         try:
-            print("async publish")
-            if not self.channel:
-                await self.connect()
-            print(f"async publish queue: {queue}")
-
-            # Объявляем очередь
-            await self.channel.declare_queue(queue, durable=True)
-            print(f"async publish message: {message}")
-            # Создаем и отправляем сообщение
-            message_body = json.dumps(message).encode()
-            print(f"async publish message_body: {message_body}")
-
-            rabbit_message = Message(
-                message_body,
-                delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-            )
-            print(f"async publish rabbit_message: {rabbit_message}")
-
-            await self.channel.default_exchange.publish(
-                rabbit_message,
-                routing_key=queue
-            )
+            await self.declare_topology()
+            print("✅ RabbitMQ reconnected, queues declared again")
+        except Exception as e:
+            # Очереди объявятся при следующей публикации
+            self._declared.clear()
+            print(f"❌ Failed to declare queues after reconnect: {e}")
+
+    async def _declare(self, channel, queue: str):
+        if queue not in self._declared:
+            await channel.declare_queue(queue, durable=True)
+            self._declared.add(queue)
+
+    async def _ensure_connected(self):
+        if self.channels is None and not await self.connect():
+            raise ConnectionError("RabbitMQ is not connected")
+
+    async def _send(self, channel, queue: str, message: dict, message_id: Optional[str] = None) -> bool:
+        rabbit_message = Message(
+            json.dumps(message).encode(),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            message_id=message_id
+        )
+        # Слот занят до подтверждения: не больше max_in_flight неподтвержденных сообщений,
+        # остальные отправители ждут здесь
+        async with self._in_flight:
+            await channel.default_exchange.publish(rabbit_message, routing_key=queue)
+        return True
 
+    async def publish(self, queue: str, message: dict, message_id: Optional[str] = None):
+        """Асинхронная публикация сообщения.
+
+        True - брокер подтвердил прием. message_id позволяет потребителю отсеять повторы.
+        """
+        try:
+            await self._ensure_connected()
+            async with self.channels.acquire() as channel:
+                await self._declare(channel, queue)
+                await self._send(channel, queue, message, message_id)
             print(f"✅ Message sent to {queue}: {message}")
             return True
 
@@ -77,6 +127,42 @@ class AsyncRabbitMQClient:
             print(f"❌ Failed to publish message to {queue}: {e}")
             return False
 
+    async def publish_batch(
+            self,
+            queue: str,
+            messages: List[dict],
+            message_ids: Optional[List[Optional[str]]] = None) -> List[bool]:
+        """Публикует пачку, не дожидаясь подтверждения каждого сообщения по очереди.
+
+        Пачка идет через один канал пула; неподтвержденными одновременно бывают
+        до max_in_flight сообщений. Результат - признак подтверждения для каждого
+        сообщения в исходном порядке.
+        """
+        if not messages:
+            return []
+        message_ids = message_ids or [None] * len(messages)
+        try:
+            await self._ensure_connected()
+            async with self.channels.acquire() as channel:
+                await self._declare(channel, queue)
+                results = await asyncio.gather(
+                    *(self._send(channel, queue, message, message_id)
+                      for message, message_id in zip(messages, message_ids)),
+                    return_exceptions=True
+                )
+        except Exception as e:
+            print(f"❌ Failed to publish {len(messages)} messages to {queue}: {e}")
+            return [False] * len(messages)
+
+        confirmed = [result is True for result in results]
+        failed = len(confirmed) - sum(confirmed)
+        if failed:
+            error = next(result for result in results if result is not True)
+            print(f"❌ {failed} of {len(messages)} messages to {queue} not confirmed: {error!r}")
+        else:
+            print(f"✅ {len(messages)} messages sent to {queue}")
+        return confirmed
+
     async def consume(self, queue: str, callback: Callable[[dict], Awaitable[None]]):
         """Асинхронное потребление сообщений из очереди"""
         try:
@@ -84,6 +170,7 @@ class AsyncRabbitMQClient:
                 await self.connect()
 
             declared_queue = await self.channel.declare_queue(queue, durable=True)
+            self._declared.add(queue)
 
             print(f"✅ Started consuming from {queue}")
 
@@ -101,6 +188,32 @@ class AsyncRabbitMQClient:
             raise
 
 
+    async def subscribe(self, exchange: str, callback: Callable[[dict], Awaitable[None]]) -> bool:
+        """Подписка на fanout exchange: у процесса своя временная очередь, сообщение получает каждый"""
+        try:
+            if self.channel is None and not await self.connect():
+                return False
+            declared_exchange = await self.channel.declare_exchange(exchange, aio_pika.ExchangeType.FANOUT,
+                                                                    durable=True)
+            # Имя выдаст брокер; exclusive - очередь удаляется вместе с соединением
+            queue = await self.channel.declare_queue(exclusive=True)
+            await queue.bind(declared_exchange)
+
+            async def on_message(message):
+                async with message.process():
+                    try:
+                        await callback(json.loads(message.body.decode()))
+                    except Exception as e:
+                        print(f"❌ Error in {exchange} subscriber: {e}")
+
+            await queue.consume(on_message)
+            print(f"✅ Subscribed to {exchange}")
+            return True
+        except Exception as e:
+            print(f"❌ Failed to subscribe to {exchange}: {e}")
+            return False
+
+
 # Глобальный асинхронный клиент
 async_client = AsyncRabbitMQClient()
 
@@ -119,6 +232,10 @@ async def publish_notification_async(notification_data: dict):
     """Асинхронная публикация уведомления"""
     return await async_client.publish("notifications", notification_data)
 
+async def subscribe_catalog_changes(callback: Callable[[dict], Awaitable[None]]):
+    """Сообщения об изменении каталога от других сервисов"""
+    return await async_client.subscribe(CATALOG_CHANGES_EXCHANGE, callback)
+
 async def consume_orders(callback: Callable[[dict], Awaitable[None]]):
     """Потребление сообщений из очереди заказов"""
     return await async_client.consume("orders", callback)
@@ -127,67 +244,41 @@ async def consume_notifications(callback: Callable[[dict], Awaitable[None]]):
     """Потребление сообщений из очереди уведомлений"""
     return await async_client.consume("notifications", callback)
 
+# Очередь, которую раньше наполняла проверка здоровья; ее никто не читает
+HEALTH_CHECK_QUEUE = "health_check"
+# Очередь для пассивной проверки (declare passive=True); пусто - только состояние соединения
+BROKER_HEALTH_QUEUE = os.getenv("BROKER_HEALTH_QUEUE", "orders")
+
 async def check_health():
-    """Проверка здоровья брокера"""
+    """Пассивная проверка брокера: соединение и канал открыты, очередь существует.
+
+    Ничего не публикует и не пишет на диск брокера.
+    """
+    connection, channel = async_client.connection, async_client.channel
+    if connection is None or connection.is_closed or channel is None or channel.is_closed:
+        return False
+    if not BROKER_HEALTH_QUEUE:
+        return True
     try:
-        return await async_client.publish("health_check", {"test": "message"})
-    except Exception:
+        # Отдельный канал: ошибка passive declare (404) закрывает канал, на котором выполнялась
+        async with connection.channel(publisher_confirms=False) as probe:
+            await probe.declare_queue(BROKER_HEALTH_QUEUE, passive=True)
+        return True
+    except Exception as e:
+        print(f"❌ RabbitMQ health check failed: {e}")
         return False
 
-# Синхронный клиент для BackgroundTasks
-class SyncRabbitMQClient:
-    def __init__(self):
-        self.url = os.getenv("RABBITMQ_URL")
-        self.connection_params = pika.URLParameters(self.url)
-
-    def publish(self, queue: str, message: dict):
-        """Синхронная публикация сообщения"""
-        try:
-            print("sync publish")
-            connection = pika.BlockingConnection(self.connection_params)
-            channel = connection.channel()
-            print(f"sync publish channel {channel}")
-
-            channel.queue_declare(queue=queue, durable=True)
-            print(f"sync publish queue {queue}")
-
-            channel.basic_publish(
-                exchange="",
-                routing_key=queue,
-                body=json.dumps(message),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                )
-            )
-            print(f"sync publish message {message}")
-
-            print(f"✅ Message sent to {queue}: {message}")
-            connection.close()
-            return True
-
-        except Exception as e:
-            print(f"❌ Failed to send message to {queue}: {e}")
-            return False
-
-sync_client = None
-
-def get_sync_client():
-    global sync_client
-    if sync_client is None:
-        sync_client = SyncRabbitMQClient()
-    return sync_client
-
-def publish_order(order_data: dict):
-    """Синхронная публикация заказа (для BackgroundTasks)"""
-    global sync_client
-    sync_client = get_sync_client()
-    return sync_client.publish("orders", order_data)
-
-def publish_notification(notification_data: dict):
-    """Синхронная публикация уведомления (для BackgroundTasks)"""
-    global sync_client
-    sync_client = get_sync_client()
-    return sync_client.publish("notifications", notification_data)
+async def delete_health_check_queue():
+    """Удаляет очередь health_check с накопленными сообщениями прежних проверок"""
+    if async_client.channel is None:
+        return False
+    try:
+        await async_client.channel.queue_delete(HEALTH_CHECK_QUEUE)
+        print(f"🧹 Queue {HEALTH_CHECK_QUEUE} deleted")
+        return True
+    except Exception as e:
+        print(f"❌ Failed to delete queue {HEALTH_CHECK_QUEUE}: {e}")
+        return False
 
 
 async def declare_exchange(self, exchange_name: str, exchange_type: str = "direct"):
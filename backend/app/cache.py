@@ -0,0 +1,360 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+REDIS_URL = os.getenv("REDIS_URL")
+INVALIDATION_CHANNEL = "aromabay:cache:invalidate"
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """Общий интерфейс кэшей: память процесса, Redis или их связка"""
+
+    _generation = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        raise NotImplementedError
+
+    def delete(self, key: Hashable):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Значение из кэша или из loader(); loader вызывается без блокировки"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self._generation
+        value = loader()
+        self._store_if_current(key, value, generation)
+        return value
+
+    def get_or_load_many(self, keys: list, loader: Callable[[list], dict]) -> dict:
+        """Как get_or_load, но промахи загружаются одним вызовом loader(missing_keys)"""
+        found, missing = {}, []
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            generation = self._generation
+            loaded = loader(missing)
+            for key, value in loaded.items():
+                self._store_if_current(key, value, generation)
+            found.update(loaded)
+        return found
+
+    def _store_if_current(self, key: Hashable, value: Any, generation: int):
+        # Если за время загрузки была инвалидация, значение уже могло устареть
+        if generation == self._generation:
+            self.set(key, value)
+
+
+class LRUCache(CacheBackend):
+    """Потокобезопасный LRU-кэш с TTL и счетчиками попаданий"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Растет при каждой инвалидации, чтобы не сохранить значение, прочитанное до нее
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _store_if_current(self, key: Hashable, value: Any, generation: int):
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value)
+
+    def _store(self, key: Hashable, value: Any, ttl: float = None):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+class RedisCache(CacheBackend):
+    """Общий для всех воркеров кэш в Redis; значения хранятся как JSON"""
+
+    def __init__(self, client: redis.Redis, namespace: str, ttl: float = 60.0):
+        self.client = client
+        self.prefix = f"aromabay:{namespace}:"
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def redis_key(self, key: Hashable) -> str:
+        return self.prefix + json.dumps(key, separators=(",", ":"))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            raw = self.client.get(self.redis_key(key))
+        except redis.RedisError as e:
+            # Redis недоступен - работаем как при промахе, данные возьмем из базы
+            self.errors += 1
+            print(f"❌ Redis cache get failed: {e}")
+            return default
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        try:
+            self.client.set(self.redis_key(key), json.dumps(value), px=int((self.ttl if ttl is None else ttl) * 1000))
+        except redis.RedisError as e:
+            self.errors += 1
+            print(f"❌ Redis cache set failed: {e}")
+
+    def delete(self, key: Hashable):
+        try:
+            self.client.unlink(self.redis_key(key))
+        except redis.RedisError as e:
+            self.errors += 1
+            print(f"❌ Redis cache delete failed: {e}")
+
+    def clear(self):
+        try:
+            batch = []
+            for redis_key in self.client.scan_iter(match=self.prefix + "*", count=500):
+                batch.append(redis_key)
+                if len(batch) == 500:
+                    self.client.unlink(*batch)
+                    batch = []
+            if batch:
+                self.client.unlink(*batch)
+        except redis.RedisError as e:
+            self.errors += 1
+            print(f"❌ Redis cache clear failed: {e}")
+
+    def stats(self) -> dict:
+        return {"ttl": self.ttl, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+class TieredCache(CacheBackend):
+    """Локальный LRU перед общим кэшем; инвалидации рассылаются остальным воркерам"""
+
+    def __init__(self, local: LRUCache, shared: CacheBackend, namespace: str,
+                 publish: Optional[Callable[[dict], None]] = None):
+        self.local = local
+        self.shared = shared
+        self.namespace = namespace
+        self.publish = publish
+
+    @property
+    def _generation(self) -> int:
+        return self.local._generation
+
+    @property
+    def ttl(self) -> float:
+        return self.local.ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.local.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        self.shared.set(key, value, ttl)
+        self.local.set(key, value, ttl)
+
+    def delete(self, key: Hashable):
+        self.shared.delete(key)
+        self.local.delete(key)
+        self._broadcast(key)
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+        self._broadcast(None)
+
+    def stats(self) -> dict:
+        return {"local": self.local.stats(), "shared": self.shared.stats()}
+
+    def handle_invalidation(self, message: dict):
+        """Инвалидация, пришедшая от другого воркера: общий кэш он уже почистил"""
+        if message.get("key") is None:
+            self.local.clear()
+        else:
+            self.local.delete(_as_key(message["key"]))
+
+    def _broadcast(self, key: Optional[Hashable]):
+        if self.publish:
+            self.publish({"namespace": self.namespace, "key": key})
+
+
+def _as_key(value):
+    # JSON превращает кортежи ключей в списки - возвращаем как было
+    return tuple(_as_key(v) for v in value) if isinstance(value, list) else value
+
+
+# Идентификатор процесса, чтобы не обрабатывать собственные сообщения
+WORKER_ID = uuid.uuid4().hex
+_redis_client: Optional[redis.Redis] = None
+_tiered_caches: "dict[str, TieredCache]" = {}
+_listener = None
+
+
+def get_redis() -> Optional[redis.Redis]:
+    global _redis_client
+    if REDIS_URL and _redis_client is None:
+        _redis_client = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _redis_client
+
+
+def _publish_invalidation(message: dict):
+    try:
+        get_redis().publish(INVALIDATION_CHANNEL, json.dumps({**message, "origin": WORKER_ID}))
+    except redis.RedisError as e:
+        print(f"❌ Redis invalidation publish failed: {e}")
+
+
+def make_cache(namespace: str, maxsize: int, ttl: float, shared_only: bool = False) -> CacheBackend:
+    """LRU в памяти процесса, а при заданном REDIS_URL - LRU поверх общего Redis.
+
+    shared_only - без Redis не кэшировать вовсе (LRU нулевого размера): инвалидация
+    дошла бы только до воркера, который ее сделал.
+    """
+    local = LRUCache(maxsize=maxsize, ttl=ttl)
+    client = get_redis()
+    if client is None:
+        return LRUCache(maxsize=0, ttl=ttl) if shared_only else local
+    cache = TieredCache(local, RedisCache(client, namespace, ttl=ttl), namespace, publish=_publish_invalidation)
+    _tiered_caches[namespace] = cache
+    return cache
+
+
+def _on_invalidation(message):
+    try:
+        data = json.loads(message["data"])
+    except (TypeError, ValueError):
+        return
+    cache = _tiered_caches.get(data.get("namespace"))
+    if cache and data.get("origin") != WORKER_ID:
+        cache.handle_invalidation(data)
+
+
+def _on_listener_error(error, pubsub, thread):
+    # Пока не было связи, могли пропустить инвалидации - локальные копии не доверяем
+    print(f"❌ Redis invalidation listener error: {error}")
+    for cache in _tiered_caches.values():
+        cache.local.clear()
+    time.sleep(1)
+
+
+def start_cache_listener():
+    """Подписка на инвалидации других воркеров (только при заданном REDIS_URL)"""
+    global _listener
+    client = get_redis()
+    if client is None or _listener is not None:
+        return
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{INVALIDATION_CHANNEL: _on_invalidation})
+    _listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=_on_listener_error)
+    print("✅ Redis cache invalidation listener started")
+
+
+def stop_cache_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def session_cache_key(token: str) -> tuple:
+    # Сам токен в ключ не кладем - в Redis его видно любому с доступом к базе
+    return ("session", hashlib.sha256(token.encode()).hexdigest())
+
+
+# Каталог меняется несколько раз в день - читаем его из памяти
+catalog_cache = make_cache(
+    "catalog",
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+)
+
+# Выход из аккаунта должен сразу действовать во всех воркерах, поэтому сессии
+# кэшируются только вместе с Redis и его рассылкой инвалидаций
+session_cache = make_cache(
+    "sessions",
+    maxsize=int(os.getenv("SESSION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SESSION_CACHE_TTL", "300")),
+    shared_only=True,
+)
@@ -0,0 +1,58 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from . import crud
+from .database import SessionLocal
+
+load_dotenv('.env')
+
+# Пустая корзина считается брошенной, если не менялась столько часов
+CART_SWEEP_AGE_HOURS = float(os.getenv("CART_SWEEP_AGE_HOURS", "24"))
+CART_SWEEP_INTERVAL = float(os.getenv("CART_SWEEP_INTERVAL", "3600"))
+CART_SWEEP_BATCH = int(os.getenv("CART_SWEEP_BATCH", "1000"))
+
+_sweeper_task = None
+
+
+def sweep_abandoned_carts(session_factory=SessionLocal) -> int:
+    """Удаляет брошенные пустые корзины пачками, каждая пачка - своя короткая транзакция"""
+    older_than = datetime.now(timezone.utc) - timedelta(hours=CART_SWEEP_AGE_HOURS)
+    total = 0
+    with session_factory() as db:
+        while True:
+            deleted = crud.delete_abandoned_carts(db, older_than, limit=CART_SWEEP_BATCH)
+            total += deleted
+            if deleted < CART_SWEEP_BATCH:
+                return total
+
+
+async def _sweep_forever():
+    while True:
+        try:
+            deleted = await run_in_threadpool(sweep_abandoned_carts)
+            if deleted:
+                print(f"🧹 Deleted {deleted} abandoned empty carts")
+        except Exception as e:
+            print(f"❌ Cart sweeper failed: {e}")
+        await asyncio.sleep(CART_SWEEP_INTERVAL)
+
+
+def start_cart_sweeper():
+    global _sweeper_task
+    if _sweeper_task is None and CART_SWEEP_INTERVAL > 0:
+        _sweeper_task = asyncio.create_task(_sweep_forever())
+
+
+async def stop_cart_sweeper():
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        try:
+            await _sweeper_task
+        except asyncio.CancelledError:
+            pass
+        _sweeper_task = None
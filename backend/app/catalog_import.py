@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import crud, schemas
+
+IMPORT_CHUNK_SIZE = 1000
+# Отчет об ошибках ограничен, чтобы битый фид не раздул ответ
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_csv(fileobj: BinaryIO) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """Строки CSV по одной; пустые ячейки считаются незаполненными"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    for row in reader:
+        # Номер физической строки файла, включая заголовок
+        yield reader.line_num, {key: value for key, value in row.items() if key and value not in (None, "")}
+
+
+def iter_ndjson(fileobj: BinaryIO) -> Iterator[Tuple[int, Union[dict, str]]]:
+    """Один JSON-объект на строку; ошибка разбора отдается вместо строки"""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig")
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_num, f"Invalid JSON: {e}"
+            continue
+        yield line_num, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> Optional[str]:
+    name = (filename or "").lower()
+    if name.endswith(".csv") or content_type == "text/csv":
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or content_type in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    return None
+
+
+class CatalogImporter:
+    def __init__(self, db: Session):
+        self.db = db
+        self.report = schemas.ImportReport()
+        # Ключ (name, brand, volume) -> (номер строки, данные); дубли в чанке схлопываем
+        self.chunk: dict = {}
+
+    def add_error(self, line: int, errors: list):
+        self.report.failed += 1
+        if len(self.report.errors) < MAX_REPORTED_ERRORS:
+            self.report.errors.append(schemas.ImportRowError(line=line, errors=errors))
+        else:
+            self.report.errors_truncated = True
+
+    def add(self, line: int, row: Union[dict, str]):
+        self.report.processed += 1
+        if isinstance(row, str):
+            self.add_error(line, [row])
+            return
+        try:
+            perfume = schemas.PerfumeImport.model_validate(row)
+        except ValidationError as e:
+            self.add_error(line, [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()])
+            return
+        # Только поля из фида: незаполненные не должны затирать остатки и описание в базе
+        data = perfume.model_dump(exclude_unset=True, exclude={"id"})
+        # В одном INSERT ... ON CONFLICT строку нельзя обновить дважды - побеждает последняя
+        self.chunk[(data["name"], data["brand"], data["volume"])] = (line, data)
+        if len(self.chunk) >= IMPORT_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.chunk:
+            return
+        entries = list(self.chunk.values())
+        self.chunk = {}
+        try:
+            inserted, updated = crud.upsert_perfumes(self.db, [data for _, data in entries])
+            self.db.commit()
+        except SQLAlchemyError:
+            # Чанк отвергнут базой - повторяем построчно, чтобы найти виноватые строки
+            self.db.rollback()
+            inserted = updated = 0
+            for line, data in entries:
+                try:
+                    row_inserted, row_updated = crud.upsert_perfumes(self.db, [data])
+                    self.db.commit()
+                except SQLAlchemyError as e:
+                    self.db.rollback()
+                    self.add_error(line, [str(e.orig) if getattr(e, "orig", None) else str(e)])
+                    continue
+                inserted += row_inserted
+                updated += row_updated
+        self.report.inserted += inserted
+        self.report.updated += updated
+
+
+def import_perfumes(db: Session, fileobj: BinaryIO, file_format: str) -> schemas.ImportReport:
+    """Потоковый импорт фида: в памяти не больше одного чанка строк"""
+    rows = iter_csv(fileobj) if file_format == "csv" else iter_ndjson(fileobj)
+    importer = CatalogImporter(db)
+    try:
+        for line, row in rows:
+            importer.add(line, row)
+        importer.flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        importer.flush()
+        # line=0 - ошибка относится к файлу целиком, дальше читать нельзя
+        importer.add_error(0, [f"File is not readable: {e}"])
+    finally:
+        if importer.report.inserted or importer.report.updated:
+            crud.invalidate_catalog()
+    return importer.report
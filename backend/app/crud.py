@@ -1,15 +1,168 @@
 import sqlalchemy
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, literal, literal_column, or_, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from . import models, schemas
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Any
 
+from .cache import catalog_cache
+from .database import replica_pool
+from .http_cache import body_etag, dump_json
 from .models import Perfume, CartItem
+from .pagination import decode_cursor, encode_cursor, parse_cursor_datetime, InvalidCursorError
 from .password_utils import hash_password, verify_password
 
 
+# Колонки ответа PerfumeResponse: списки читаются строками, без ORM-объектов
+PERFUME_COLUMNS = (
+    models.Perfume.id,
+    models.Perfume.name,
+    models.Perfume.brand,
+    models.Perfume.price,
+    models.Perfume.perfume_type,
+    models.Perfume.description,
+    models.Perfume.img_url,
+    models.Perfume.stock_quantity,
+    models.Perfume.volume,
+    models.Perfume.concentration,
+    models.Perfume.created_at,
+)
+
 # Perfume CRUD
-def get_perfumes(db: Session, skip: int = 0, limit: int = 100) -> list[type[Perfume]]:
-    return db.query(models.Perfume).offset(skip).limit(limit).all()
+def get_perfumes(
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        after: Optional[str] = None,
+        rows: bool = False) -> list[type[Perfume]]:
+    query = db.query(*PERFUME_COLUMNS) if rows else db.query(models.Perfume)
+    query = query.order_by(models.Perfume.id)
+    if after:
+        # Keyset: продолжаем с id последней строки, без сканирования пропущенных
+        (last_id,) = decode_cursor(after, "perfumes", 1)
+        if not isinstance(last_id, int):
+            raise InvalidCursorError("Invalid cursor")
+        query = query.filter(models.Perfume.id > last_id)
+    else:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+def perfume_cursor(perfume: models.Perfume) -> str:
+    return encode_cursor("perfumes", perfume.id)
+
+# Колонки ключа сортировки каталога и направление
+CATALOG_SORTS = {
+    schemas.CatalogSort.ID: ((models.Perfume.id,), False),
+    schemas.CatalogSort.PRICE_ASC: ((models.Perfume.price, models.Perfume.id), False),
+    schemas.CatalogSort.PRICE_DESC: ((models.Perfume.price, models.Perfume.id), True),
+    schemas.CatalogSort.NEWEST: ((models.Perfume.created_at, models.Perfume.id), True),
+    schemas.CatalogSort.NAME: ((models.Perfume.name, models.Perfume.id), False),
+}
+
+# Допустимые типы значений курсора каталога по колонкам ключа сортировки
+CATALOG_CURSOR_TYPES = {"id": int, "price": (int, float), "name": str}
+
+def _catalog_cursor_values(columns: tuple, values: list) -> list:
+    """Значения курсора после проверки типов: мусор в курсоре - 400, а не ошибка базы"""
+    parsed = []
+    for column, value in zip(columns, values):
+        if column.key == "created_at":
+            value = parse_cursor_datetime(value)
+        elif isinstance(value, bool) or not isinstance(value, CATALOG_CURSOR_TYPES[column.key]):
+            raise InvalidCursorError("Invalid cursor")
+        parsed.append(value)
+    return parsed
+
+def _catalog_conditions(filters: schemas.CatalogFilters, skip: tuple = ()) -> list:
+    """WHERE-условия каталога; skip - измерения, которые не учитываем (для фасетов)"""
+    conditions = []
+    if filters.brands and "brand" not in skip:
+        conditions.append(models.Perfume.brand.in_(filters.brands))
+    if filters.perfume_types and "perfume_type" not in skip:
+        conditions.append(models.Perfume.perfume_type.in_(filters.perfume_types))
+    if filters.min_price is not None:
+        conditions.append(models.Perfume.price >= filters.min_price)
+    if filters.max_price is not None:
+        conditions.append(models.Perfume.price <= filters.max_price)
+    if filters.volumes:
+        conditions.append(models.Perfume.volume.in_(filters.volumes))
+    if filters.in_stock:
+        conditions.append(models.Perfume.stock_quantity > 0)
+    return conditions
+
+def get_catalog(
+        db: Session,
+        filters: schemas.CatalogFilters,
+        sort: schemas.CatalogSort = schemas.CatalogSort.ID,
+        limit: int = 100,
+        after: Optional[str] = None,
+        rows: bool = False) -> List[models.Perfume]:
+    columns, descending = CATALOG_SORTS[sort]
+    query = db.query(*PERFUME_COLUMNS) if rows else db.query(models.Perfume)
+    query = query.filter(*_catalog_conditions(filters))
+    if after:
+        values = _catalog_cursor_values(columns, decode_cursor(after, f"catalog:{sort.value}", len(columns)))
+        key, last = tuple_(*columns), tuple_(*values)
+        query = query.filter(key < last if descending else key > last)
+    order = [c.desc() if descending else c.asc() for c in columns]
+    return query.order_by(*order).limit(limit).all()
+
+def catalog_cursor(perfume: models.Perfume, sort: schemas.CatalogSort) -> str:
+    columns, _ = CATALOG_SORTS[sort]
+    return encode_cursor(f"catalog:{sort.value}", *(getattr(perfume, c.key) for c in columns))
+
+def get_catalog_facets(db: Session, filters: schemas.CatalogFilters) -> dict:
+    """Счетчики по брендам и типам; свое измерение не сужает собственный фасет"""
+    brands = (db.query(models.Perfume.brand, func.count())
+              .filter(*_catalog_conditions(filters, skip=("brand",)))
+              .group_by(models.Perfume.brand)
+              .all())
+    perfume_types = (db.query(models.Perfume.perfume_type, func.count())
+                     .filter(*_catalog_conditions(filters, skip=("perfume_type",)))
+                     .group_by(models.Perfume.perfume_type)
+                     .all())
+    return {
+        "brands": {brand: count for brand, count in brands},
+        "perfume_types": {perfume_type.value: count for perfume_type, count in perfume_types},
+    }
+
+def search_perfumes(db: Session, q: str, limit: int = 20) -> List[models.Perfume]:
+    """Поиск по названию, бренду и описанию, самые релевантные первыми"""
+    if db.get_bind().dialect.name != "postgresql":
+        # Без tsvector и pg_trgm (SQLite в тестах) - простой ILIKE
+        pattern = f"%{q}%"
+        return (db.query(models.Perfume)
+                .filter(or_(models.Perfume.name.ilike(pattern),
+                            models.Perfume.brand.ilike(pattern),
+                            models.Perfume.description.ilike(pattern)))
+                .order_by(models.Perfume.id)
+                .limit(limit)
+                .all())
+
+    # Полнотекстовый поиск по GIN-индексу search_vector
+    search_vector = literal_column("perfumes.search_vector")
+    ts_query = func.websearch_to_tsquery("simple", q)
+    found = (db.query(models.Perfume)
+             .filter(search_vector.op("@@")(ts_query))
+             .order_by(func.ts_rank_cd(search_vector, ts_query).desc(), models.Perfume.id)
+             .limit(limit)
+             .all())
+    if len(found) >= limit:
+        return found
+
+    # Добираем опечатки и недописанные слова через триграммы (word_similarity)
+    similarity = func.greatest(func.word_similarity(q, models.Perfume.name),
+                               func.word_similarity(q, models.Perfume.brand))
+    fuzzy = (db.query(models.Perfume)
+             .filter(or_(models.Perfume.name.op("%>")(q), models.Perfume.brand.op("%>")(q)),
+                     models.Perfume.id.notin_([p.id for p in found]))
+             .order_by(similarity.desc(), models.Perfume.id)
+             .limit(limit - len(found))
+             .all())
+    return found + fuzzy
 
 def get_perfume(db: Session, perfume_id: int) -> Optional[models.Perfume]:
     return db.query(models.Perfume).filter(models.Perfume.id == perfume_id).first()
@@ -18,6 +171,7 @@ def create_perfume(db: Session, perfume: schemas.PerfumeCreate) -> models.Perfum
     db_perfume = models.Perfume(**perfume.model_dump())
     db.add(db_perfume)
     db.commit()
+    invalidate_catalog()
     db.refresh(db_perfume)
     return db_perfume
 
@@ -26,127 +180,418 @@ def delete_perfume(db: Session, perfume_id: int):
     if perfume:
         db.delete(perfume)
         db.commit()
+        invalidate_catalog()
         return perfume
     return None
 
+# Ключ сопоставления строк фида с каталогом (uq_perfumes_name_brand_volume)
+PERFUME_IMPORT_KEY = ("name", "brand", "volume")
+
+def upsert_perfumes(db: Session, rows: List[dict]) -> tuple[int, int]:
+    """Многострочный INSERT ... ON CONFLICT по (name, brand, volume).
+
+    Строки содержат только заполненные в фиде поля; отсутствующее поле не затирает
+    значение в базе. Поэтому строки с разным набором колонок идут разными запросами.
+    Возвращает (добавлено, обновлено); коммит и инвалидация кэша - на вызывающем.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    inserted = updated = 0
+    for group in groups.values():
+        group_inserted, group_updated = _upsert_perfume_group(db, group)
+        inserted += group_inserted
+        updated += group_updated
+    return inserted, updated
+
+def _upsert_perfume_group(db: Session, rows: List[dict]) -> tuple[int, int]:
+    stmt = _insert_for(db)(models.Perfume).values(rows)
+    updatable = [key for key in rows[0] if key not in PERFUME_IMPORT_KEY]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(PERFUME_IMPORT_KEY),
+        set_={key: stmt.excluded[key] for key in updatable},
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        # xmax = 0 только у строк, которые вставлены, а не обновлены этим запросом
+        inserted_flags = db.execute(stmt.returning(literal_column("xmax = 0"))).scalars().all()
+        inserted = sum(1 for flag in inserted_flags if flag)
+        return inserted, len(inserted_flags) - inserted
+    # SQLite (тесты): xmax нет, существующие ключи считаем до вставки
+    keys = [tuple(row[key] for key in PERFUME_IMPORT_KEY) for row in rows]
+    existing = (db.query(func.count())
+                .filter(tuple_(models.Perfume.name, models.Perfume.brand, models.Perfume.volume).in_(keys))
+                .scalar())
+    db.execute(stmt)
+    return len(rows) - existing, existing
+
+# Кэш каталога: в памяти лежат готовые JSON-тела ответов и их ETag, поэтому
+# попадание в кэш не трогает ни ORM, ни pydantic
+def invalidate_catalog():
+    """Вызывать после любого изменения perfumes (создание, удаление, остатки)"""
+    # Ближайшие чтения - из primary, иначе кэш заполнится данными отстающей реплики
+    replica_pool.note_write()
+    catalog_cache.clear()
+
+def _perfume_row(row) -> dict:
+    perfume = row._asdict()
+    perfume["perfume_type"] = perfume["perfume_type"].value
+    return perfume
+
+def _page(rows: list, next_cursor: Optional[str]) -> dict:
+    items_json = dump_json([_perfume_row(row) for row in rows])
+    return {"items_json": items_json, "next_cursor": next_cursor, "etag": body_etag(items_json, next_cursor or "")}
+
+def cached_perfume(db: Session, perfume_id: int) -> dict:
+    def load():
+        row = db.query(*PERFUME_COLUMNS).filter(models.Perfume.id == perfume_id).first()
+        item_json = dump_json(_perfume_row(row)) if row else None
+        return {"item_json": item_json, "etag": body_etag(item_json or "")}
+    return catalog_cache.get_or_load(("perfume", perfume_id), load)
+
+def cached_perfumes_by_ids(db: Session, perfume_ids: List[int]) -> dict:
+    """Карточки из кэша; все промахи дочитываются одним запросом WHERE id IN (...)"""
+    def load(keys):
+        ids = [perfume_id for _, perfume_id in keys]
+        rows = {row.id: row for row in db.query(*PERFUME_COLUMNS).filter(models.Perfume.id.in_(ids))}
+        entries = {}
+        for perfume_id in ids:
+            item_json = dump_json(_perfume_row(rows[perfume_id])) if perfume_id in rows else None
+            entries[("perfume", perfume_id)] = {"item_json": item_json, "etag": body_etag(item_json or "")}
+        return entries
+    entries = catalog_cache.get_or_load_many([("perfume", perfume_id) for perfume_id in perfume_ids], load)
+    return {perfume_id: entries[("perfume", perfume_id)] for perfume_id in perfume_ids}
+
+def cached_perfumes(db: Session, skip: int = 0, limit: int = 100, after: Optional[str] = None) -> dict:
+    def load():
+        rows = get_perfumes(db, skip=skip, limit=limit, after=after, rows=True)
+        return _page(rows, perfume_cursor(rows[-1]) if len(rows) == limit else None)
+    return catalog_cache.get_or_load(("perfumes", skip, limit, after), load)
+
+def cached_catalog(
+        db: Session,
+        filters: schemas.CatalogFilters,
+        sort: schemas.CatalogSort = schemas.CatalogSort.ID,
+        limit: int = 100,
+        after: Optional[str] = None) -> dict:
+    def load():
+        rows = get_catalog(db, filters, sort=sort, limit=limit, after=after, rows=True)
+        return _page(rows, catalog_cursor(rows[-1], sort) if len(rows) == limit else None)
+    return catalog_cache.get_or_load(("catalog", filters.model_dump_json(), sort.value, limit, after), load)
+
+def cached_catalog_facets(db: Session, filters: schemas.CatalogFilters) -> dict:
+    def load():
+        facets_json = dump_json(get_catalog_facets(db, filters))
+        return {"facets_json": facets_json, "etag": body_etag(facets_json)}
+    return catalog_cache.get_or_load(("facets", filters.model_dump_json()), load)
+
 # Order CRUD
-def create_order(db: Session, order: schemas.OrderCreate, user_id: int) -> models.Order:
-    # Создаем заказ
+def create_order(
+        db: Session,
+        order: schemas.OrderCreate,
+        user_id: int,
+        contacts: Optional[dict] = None) -> models.Order:
+    """Заказ, все позиции и событие для бота одной транзакцией: flush ради id, пачка позиций, один commit"""
     db_order = models.Order(
         user_id=user_id,
         status=order.status,
         total_amount=sum(item.price * item.quantity for item in order.items)
     )
     db.add(db_order)
+    db.flush()
+
+    # Все позиции одним INSERT ... VALUES (...), (...) RETURNING - сразу ORM-объекты с id
+    items = db.scalars(
+        sqlalchemy.insert(models.OrderItem)
+        .values([{"order_id": db_order.id, "perfume_id": item.perfume_id, "quantity": item.quantity,
+                  "price": item.price} for item in order.items])
+        .returning(models.OrderItem)
+    ).all() if order.items else []
+    # Без этого обращение к items после commit ушло бы в базу отдельным запросом
+    set_committed_value(db_order, "items", sorted(items, key=lambda item: item.id))
+    add_order_event(db, order_event(db_order.id, db_order.status, db_order.total_amount,
+                                    [_order_item_dict(item) for item in db_order.items], contacts))
     db.commit()
-    db.refresh(db_order)
-
-    # Создаем элементы заказа
-    for item in order.items:
-        db_item = models.OrderItem(
-            order_id=db_order.id,
-            perfume_id=item.perfume_id,
-            quantity=item.quantity,
-            price=item.price
-        )
-        db.add(db_item)
-
-    db.commit()
-    db.refresh(db_order)
     return db_order
 
-def get_orders(db: Session, skip: int = 0, limit: int = 100) -> List[models.Order]:
-    return db.query(models.Order).order_by(models.Order.created_at.desc()).offset(skip).limit(limit).all()
-
-#cart CRUD
-def get_cart(db: Session, user_id: int):
-    cart = db.query(models.Cart).filter(models.Cart.user_id == user_id).first()
-    if not cart:
-        cart = models.Cart(user_id=user_id)
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
-    return cart
+def _order_item_dict(item) -> dict:
+    return {"id": item.id, "perfume_id": item.perfume_id, "quantity": item.quantity, "price": item.price}
 
-def get_cart_items(db: Session, user_id: int):
-    cart = get_cart(db, user_id)
+def order_event(order_id: int, status: str, total_amount: float, items: List[dict], contacts: Optional[dict]) -> dict:
+    """Сообщение в очередь orders; contacts - telegram_username и user_email для бота"""
+    return {"id": order_id, "status": status, "total_amount": total_amount, **(contacts or {}), "items": items}
 
-    if not cart:
-        return {"id":cart.id, "user_id": user_id, "items": []}
+def add_order_event(db: Session, payload: dict):
+    # Без commit: событие сохраняется вместе с заказом или не сохраняется вовсе
+    db.add(models.OutboxEvent(queue="orders", payload=payload))
 
-    cart_items = (db.query(models.CartItem)
-                  .filter(models.CartItem.cart_id == cart.id)
-                  .options(sqlalchemy.orm.joinedload(models.CartItem.perfume))
-                  .all())
+def get_orders(
+        db: Session,
+        skip: int = 0,
+        limit: int = 100,
+        after: Optional[str] = None,
+        user_id: Optional[int] = None) -> List[models.Order]:
+    """Заказы, новые первыми; user_id - только заказы этого пользователя"""
+    query = (db.query(models.Order)
+             .options(selectinload(models.Order.items), joinedload(models.Order.user))
+             .order_by(models.Order.created_at.desc(), models.Order.id.desc()))
+    if user_id is not None:
+        query = query.filter(models.Order.user_id == user_id)
+    if after:
+        # Keyset по (created_at, id) - идет по индексу ix_orders_created_at_id
+        created_at, last_id = decode_cursor(after, "orders", 2)
+        if not isinstance(last_id, int):
+            raise InvalidCursorError("Invalid cursor")
+        created_at = parse_cursor_datetime(created_at)
+        query = query.filter(tuple_(models.Order.created_at, models.Order.id) < tuple_(created_at, last_id))
+    else:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
-    return {"id":cart.id, "user_id": user_id, "items": cart_items}
+def order_cursor(order: models.Order) -> str:
+    return encode_cursor("orders", order.created_at, order.id)
 
+#cart CRUD
+# Корзина - одна строка carts на пользователя (uq_carts_user_id) и по строке cart_items
+# на духи (uq_cart_items_cart_perfume); изменения идут upsert-ами по этим ключам,
+# поэтому параллельные клики "в корзину" не плодят дубли и не теряют количество
+def _insert_for(db: Session):
+    """INSERT ... ON CONFLICT под диалект сессии: Postgres в проде, SQLite в тестах"""
+    return pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+def _cart_upsert(db: Session, user_id: int):
+    # DO UPDATE вместо DO NOTHING, чтобы RETURNING вернул id и существующей корзины.
+    # Заодно строка корзины блокируется до commit - изменения одной корзины идут по очереди
+    # Версии монотонны для пользователя: после удаления корзины счет продолжается
+    next_version = select(models.User.cart_version + 1).where(models.User.id == user_id).scalar_subquery()
+    stmt = _insert_for(db)(models.Cart).values(user_id=user_id, version=func.coalesce(next_version, 1))
+    return (stmt.on_conflict_do_update(index_elements=[models.Cart.user_id],
+                                       set_={"updated_at": func.now(), "version": models.Cart.version + 1})
+            .returning(models.Cart.id))
+
+def _bump_cart(db: Session, user_id: int, create: bool) -> Optional[int]:
+    """Новая версия корзины и ее id; без create отсутствующая корзина не создается (None)"""
+    if create:
+        return db.execute(_cart_upsert(db, user_id)).scalar_one()
+    return db.execute(update(models.Cart)
+                      .where(models.Cart.user_id == user_id)
+                      .values(version=models.Cart.version + 1, updated_at=func.now())
+                      .returning(models.Cart.id)
+                      .execution_options(synchronize_session=False)).scalar_one_or_none()
+
+def get_cart(db: Session, user_id: int) -> Optional[models.Cart]:
+    # Только чтение: строка корзины появляется при первом добавлении товара
+    return db.query(models.Cart).filter(models.Cart.user_id == user_id).first()
+
+def _cart_response(db: Session, user_id: int) -> Optional[dict]:
+    """Корзина с позициями и духами одним запросом"""
+    cart = (db.query(models.Cart)
+            .options(joinedload(models.Cart.items).joinedload(models.CartItem.perfume))
+            .filter(models.Cart.user_id == user_id)
+            # Количества меняются upsert-ами мимо ORM - не верим объектам из identity map
+            .execution_options(populate_existing=True)
+            .first())
+    if not cart:
+        return None
+    return {"id": cart.id, "user_id": user_id, "items": sorted(cart.items, key=lambda item: item.id),
+            "version": cart.version}
 
-def add_to_cart(db: Session, user_id: int, item_data: schemas.CartItemCreate) -> models.Cart:
-    # Создаем заказ
-    cart = get_cart(db, user_id)
+def get_cart_items(db: Session, user_id: int):
+    # Нет корзины - отдаем пустую виртуальную (id=None), ничего не записывая
+    return _cart_response(db, user_id) or {"id": None, "user_id": user_id, "items": [], "version": 0}
+
+def delete_abandoned_carts(db: Session, older_than: datetime, limit: int = 1000) -> int:
+    """Удаляет до limit пустых корзин, не менявшихся с older_than; возвращает число удаленных"""
+    has_items = select(models.CartItem.id).where(models.CartItem.cart_id == models.Cart.id).exists()
+    abandoned = (select(models.Cart.id)
+                 .where(~has_items, func.coalesce(models.Cart.updated_at, models.Cart.created_at) < older_than)
+                 .limit(limit)
+                 # Корзину, в которую прямо сейчас добавляют товар, пропускаем
+                 .with_for_update(skip_locked=True))
+    deleted = db.execute(delete(models.Cart).where(models.Cart.id.in_(abandoned))
+                         .returning(models.Cart.user_id, models.Cart.version)
+                         .execution_options(synchronize_session=False)).all()
+    if deleted:
+        # Запоминаем последнюю версию, иначе старая версия совпала бы с версией новой корзины
+        db.execute(update(models.User), [{"id": user_id, "cart_version": version} for user_id, version in deleted])
+    db.commit()
+    return len(deleted)
 
-    existing_item =  get_cart_item(db, cart.id, item_data.perfume_id)
 
-    if existing_item:
-        existing_item.quantity += item_data.quantity
+def add_to_cart(db: Session, user_id: int, item_data: schemas.CartItemCreate) -> dict:
+    insert = _insert_for(db)
+    if db.get_bind().dialect.name == "postgresql":
+        # Корзина и позиция одним запросом: CTE создает корзину, если ее еще нет
+        cart = _cart_upsert(db, user_id).cte("cart")
+        source = select(cart.c.id, literal(item_data.perfume_id), literal(item_data.quantity))
     else:
-        new_item = models.CartItem(
-            cart_id = cart.id,
-            perfume_id = item_data.perfume_id,
-            quantity = item_data.quantity
-        )
-        db.add(new_item)
+        cart_id = db.execute(_cart_upsert(db, user_id)).scalar_one()
+        source = select(literal(cart_id), literal(item_data.perfume_id), literal(item_data.quantity))
+    stmt = insert(models.CartItem).from_select(["cart_id", "perfume_id", "quantity"], source)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.CartItem.cart_id, models.CartItem.perfume_id],
+        # Прибавляем в базе, а не в Python - параллельные добавления не теряются
+        set_={"quantity": models.CartItem.quantity + stmt.excluded.quantity},
+    ))
     db.commit()
-    return cart
-
+    return _cart_response(db, user_id)
+
+
+def fold_cart_operations(operations: List[schemas.CartOperation]) -> dict:
+    """Сводит операции к одному итоговому действию на духи: ("set", q) или ("add", q)"""
+    final = {}
+    for operation in operations:
+        if operation.op == schemas.CartOperationType.REMOVE:
+            final[operation.perfume_id] = ("set", 0)
+        elif operation.op == schemas.CartOperationType.SET:
+            final[operation.perfume_id] = ("set", operation.quantity)
+        else:
+            kind, quantity = final.get(operation.perfume_id, ("add", 0))
+            final[operation.perfume_id] = (kind, quantity + operation.quantity)
+    return final
+
+def apply_cart_operations(db: Session, user_id: int, operations: List[schemas.CartOperation]) -> dict:
+    """Пачка изменений корзины одной транзакцией: не больше одного DELETE и двух bulk upsert-ов"""
+    final = fold_cart_operations(operations)
+    removed = [perfume_id for perfume_id, (kind, quantity) in final.items() if kind == "set" and quantity == 0]
+    absolute = [{"perfume_id": perfume_id, "quantity": quantity}
+                for perfume_id, (kind, quantity) in final.items() if kind == "set" and quantity > 0]
+    deltas = [{"perfume_id": perfume_id, "quantity": quantity}
+              for perfume_id, (kind, quantity) in final.items() if kind == "add"]
+
+    # Одни удаления не создают корзину: если ее нет, удалять нечего
+    cart_id = _bump_cart(db, user_id, create=bool(absolute or deltas))
+    if cart_id is None:
+        return get_cart_items(db, user_id)
+
+    if removed:
+        db.execute(delete(models.CartItem)
+                   .where(models.CartItem.cart_id == cart_id, models.CartItem.perfume_id.in_(removed))
+                   .execution_options(synchronize_session=False))
+    insert = _insert_for(db)
+    for rows, additive in ((absolute, False), (deltas, True)):
+        if not rows:
+            continue
+        stmt = insert(models.CartItem).values([{"cart_id": cart_id, **row} for row in rows])
+        quantity = models.CartItem.quantity + stmt.excluded.quantity if additive else stmt.excluded.quantity
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[models.CartItem.cart_id, models.CartItem.perfume_id],
+            set_={"quantity": quantity},
+        ))
+    db.commit()
+    return _cart_response(db, user_id)
 
 def update_perfume_quantity(
         db: Session,
         user_id: int,
         perfume_id: int,
         quantity: int):
-    cart = get_cart(db, user_id)
-
-    cart_item = get_cart_item(db, cart.id, perfume_id)
-
-    if cart_item:
-        cart_item.quantity = quantity
-        db.commit()
-
-    return get_cart_items(db, user_id)
+    return apply_cart_operations(db, user_id, [
+        schemas.CartOperation(op=schemas.CartOperationType.SET, perfume_id=perfume_id, quantity=quantity)
+    ])
 
 def remove_item_from_cart(db: Session, user_id: int, perfume_id: int):
-    cart = get_cart(db, user_id)
-
-    cart_item = get_cart_item(db, cart.id, perfume_id)
-
-    if cart_item:
-        db.delete(cart_item)
-        db.commit()
-
-    return get_cart_items(db, user_id)
+    return apply_cart_operations(db, user_id, [
+        schemas.CartOperation(op=schemas.CartOperationType.REMOVE, perfume_id=perfume_id)
+    ])
 
 def remove_from_cart(db: Session, user_id: int):
-    cart = get_cart(db, user_id)
-
-    # cart_item = get_cart_item(db, cart.id)
-
-    if cart:
-        db.delete(cart)
+    # Сама корзина остается, очищаем только позиции
+    cart_id = _bump_cart(db, user_id, create=False)
+    if cart_id is not None:
+        db.execute(delete(models.CartItem).where(models.CartItem.cart_id == cart_id)
+                   .execution_options(synchronize_session=False))
         db.commit()
-
     return get_cart_items(db, user_id)
 
+def checkout_cart(db: Session, user_id: int, contacts: Optional[dict] = None) -> Optional[dict]:
+    """Заказ из корзины по текущим ценам каталога; None - корзина пуста"""
+    # Новая версия блокирует корзину: повторный checkout дождется commit и увидит ее пустой
+    cart_id = _bump_cart(db, user_id, create=False)
+    if cart_id is None:
+        return None
+    lines = db.execute(select(models.CartItem.perfume_id, models.CartItem.quantity, models.Perfume.price)
+                       .join(models.Perfume, models.Perfume.id == models.CartItem.perfume_id)
+                       # Строки с неположительным количеством (остались от старых клиентов) в заказ не идут
+                       .where(models.CartItem.cart_id == cart_id, models.CartItem.quantity > 0)
+                       .order_by(models.CartItem.id)).all()
+    if not lines:
+        db.rollback()
+        return None
+
+    order = db.execute(sqlalchemy.insert(models.Order)
+                       .values(user_id=user_id, status="Created",
+                               total_amount=sum(line.price * line.quantity for line in lines))
+                       .returning(models.Order.id, models.Order.status, models.Order.total_amount)).one()
+    # Все позиции одним INSERT ... VALUES (...), (...) RETURNING
+    items = db.execute(sqlalchemy.insert(models.OrderItem)
+                       .values([{"order_id": order.id, "perfume_id": line.perfume_id,
+                                 "quantity": line.quantity, "price": line.price} for line in lines])
+                       .returning(models.OrderItem.id, models.OrderItem.perfume_id,
+                                  models.OrderItem.quantity, models.OrderItem.price)).all()
+    db.execute(delete(models.CartItem).where(models.CartItem.cart_id == cart_id)
+               .execution_options(synchronize_session=False))
+    event = order_event(order.id, order.status, order.total_amount,
+                        [item._asdict() for item in sorted(items, key=lambda item: item.id)], contacts)
+    add_order_event(db, event)
+    db.commit()
+    return event
+
 def get_cart_item(db: Session, cart_id: int, perfume_id: int):
     return (db.query(models.CartItem).
                  filter(models.CartItem.cart_id == cart_id,
                         models.CartItem.perfume_id == perfume_id)
                  .first())
 
+#outbox CRUD
+# Диспетчер берет строки в аренду: сдвигает available_at вперед и коммитит сразу,
+# поэтому публикация в RabbitMQ идет без открытой транзакции. Не подтвержденная
+# брокером строка после аренды вернется в выборку - доставка "хотя бы один раз"
+def claim_outbox_events(db: Session, limit: int, lease_seconds: float) -> list:
+    now = datetime.now(timezone.utc)
+    # SKIP LOCKED: несколько воркеров разбирают разные пачки
+    due = (select(models.OutboxEvent.id)
+           .where(models.OutboxEvent.available_at <= now)
+           .order_by(models.OutboxEvent.id)
+           .limit(limit)
+           .with_for_update(skip_locked=True))
+    events = db.execute(update(models.OutboxEvent)
+                        .where(models.OutboxEvent.id.in_(due))
+                        .values(available_at=now + timedelta(seconds=lease_seconds),
+                                attempts=models.OutboxEvent.attempts + 1)
+                        .returning(models.OutboxEvent.id, models.OutboxEvent.queue,
+                                   models.OutboxEvent.payload, models.OutboxEvent.attempts)
+                        .execution_options(synchronize_session=False)).all()
+    db.commit()
+    return sorted(events, key=lambda event: event.id)
+
+def complete_outbox_events(db: Session, event_ids: List[int]):
+    db.execute(delete(models.OutboxEvent).where(models.OutboxEvent.id.in_(event_ids))
+               .execution_options(synchronize_session=False))
+    db.commit()
+
+def retry_outbox_events(db: Session, event_ids: List[int], delay_seconds: float, error: str):
+    db.execute(update(models.OutboxEvent)
+               .where(models.OutboxEvent.id.in_(event_ids))
+               .values(available_at=datetime.now(timezone.utc) + timedelta(seconds=delay_seconds),
+                       last_error=error[:1000])
+               .execution_options(synchronize_session=False))
+    db.commit()
+
+def outbox_lag(db: Session) -> dict:
+    """Сколько событий ждут публикации и возраст самого старого из них"""
+    pending, oldest = db.execute(select(func.count(models.OutboxEvent.id),
+                                        func.min(models.OutboxEvent.created_at))).one()
+    if oldest is not None and oldest.tzinfo is None:
+        # SQLite возвращает время без зоны, CURRENT_TIMESTAMP в UTC
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    lag = (datetime.now(timezone.utc) - oldest).total_seconds() if oldest is not None else 0.0
+    return {"pending": pending, "lag_seconds": round(max(lag, 0.0), 3)}
+
 #user CRUD
-def create_user(db: Session, new_user_data: schemas.UserRegister) -> models.User :
-    hashed_password = hash_password(new_user_data.password).decode('utf-8')
+def create_user(db: Session, new_user_data: schemas.UserRegister, hashed_password: Optional[str] = None) -> models.User :
+    # bcrypt медленный - async-роутеры считают хэш заранее в пуле потоков
+    if hashed_password is None:
+        hashed_password = hash_password(new_user_data.password).decode('utf-8')
 
     user = models.User(
         username = new_user_data.username,
@@ -1,17 +1,265 @@
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
+from typing import Callable, List, Optional, TypeVar, Union
+import itertools
 import os
+import time
+
+from .cache import get_redis
+from .pool_metrics import PoolMetrics, instrumented_pool_class, pool_stats
+from .query_stats import instrument_engine
 # Для разработки
 load_dotenv('.env')
 DATABASE_URL = os.getenv("DATABASE_URL")
+# true - роутеры работают через AsyncSession/asyncpg, false - через синхронный движок в пуле потоков
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+# Реплики для чтения через запятую; пусто - все идет в primary
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+# Как часто перепроверять реплику запросом SELECT 1, сек
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# Сколько секунд после записи читать из primary, чтобы не закэшировать отстающую реплику
+DB_REPLICA_WRITE_STICKINESS = float(os.getenv("DB_REPLICA_WRITE_STICKINESS", "5"))
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+# Пул соединений на процесс; при нескольких воркерах считайте суммарно против max_connections
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Соединения старше этого (сек) переоткрываются - PgBouncer/балансировщики рвут простаивающие
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+def pool_options(url: str, pool_class: type, metrics: PoolMetrics) -> dict:
+    """Настройки пула для create_engine; у SQLite свой пул, его не трогаем"""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": instrumented_pool_class(pool_class, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Объекты после commit не протухают: к ним обращаются уже вне сессии,
+# и ленивая подгрузка в async-коде заблокировала бы event loop
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, QueuePool, sync_pool_metrics))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+instrument_engine(engine)
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def async_database_url(url: str) -> str:
+    """Тот же DATABASE_URL, но с асинхронным драйвером"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+# Асинхронный движок создаем только когда он нужен - иначе asyncpg не обязателен
+async_engine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    **pool_options(DATABASE_URL, AsyncAdaptedQueuePool, async_pool_metrics)
+) if DB_ASYNC else None
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) if DB_ASYNC else None
+)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+
+AnySession = Union[Session, AsyncSession]
+T = TypeVar("T")
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Зависимость для роутеров: режим выбирается переменной DB_ASYNC
+get_session = get_async_db if DB_ASYNC else get_db
+
+class Replica:
+    """Движки одной реплики и результат последней проверки ее доступности"""
+
+    def __init__(self, url: str, use_async: bool = DB_ASYNC):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_engine(url, **pool_options(url, QueuePool, PoolMetrics()))
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine)
+        self.async_engine = create_async_engine(
+            async_database_url(url), **pool_options(url, AsyncAdaptedQueuePool, PoolMetrics())
+        ) if use_async else None
+        self.async_session_factory = (
+            async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False) if use_async else None
+        )
+        instrument_engine(self.engine)
+        if self.async_engine is not None:
+            instrument_engine(self.async_engine.sync_engine)
+        self.healthy = True
+        self.checked_at = float("-inf")
+
+    def check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self.checked_at < DB_REPLICA_CHECK_INTERVAL:
+            return False
+        # Отмечаем сразу, чтобы параллельные запросы не проверяли реплику хором
+        self.checked_at = now
+        return True
+
+    def set_health(self, healthy: bool, error: Exception = None):
+        if healthy and not self.healthy:
+            print(f"✅ Replica {self.name} is back")
+        elif not healthy and self.healthy:
+            print(f"❌ Replica {self.name} is down: {error}")
+        self.healthy = healthy
+
+    def mark_down(self, error: Exception = None):
+        self.checked_at = time.monotonic()
+        self.set_health(False, error)
+
+    def is_healthy(self) -> bool:
+        if self.check_due():
+            try:
+                with self.engine.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+                self.set_health(True)
+            except SQLAlchemyError as e:
+                self.set_health(False, e)
+        return self.healthy
+
+    async def is_healthy_async(self) -> bool:
+        if self.check_due():
+            try:
+                async with self.async_engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+                self.set_health(True)
+            except SQLAlchemyError as e:
+                self.set_health(False, e)
+        return self.healthy
+
+    def stats(self) -> dict:
+        engine = self.async_engine.sync_engine if self.async_engine is not None else self.engine
+        return {"name": self.name, "healthy": self.healthy, **pool_stats(engine.pool)}
+
+    async def dispose(self):
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        self.engine.dispose()
+
+
+class ReplicaPool:
+    """Реплики по кругу; недоступные пропускаются, без реплик читаем из primary"""
+
+    def __init__(self, urls: List[str], use_async: bool = DB_ASYNC):
+        self.replicas = [Replica(url, use_async) for url in urls]
+        self._counter = itertools.count()
+        self._last_write = float("-inf")
+
+    def note_write(self):
+        # Только в пределах процесса: другие воркеры узнают о записи через инвалидацию кэша
+        self._last_write = time.monotonic()
+
+    def candidates(self) -> List[Replica]:
+        if not self.replicas or time.monotonic() - self._last_write < DB_REPLICA_WRITE_STICKINESS:
+            return []
+        start = next(self._counter)
+        return [self.replicas[(start + i) % len(self.replicas)] for i in range(len(self.replicas))]
+
+    def pick(self) -> Optional[Replica]:
+        return next((replica for replica in self.candidates() if replica.is_healthy()), None)
+
+    async def pick_async(self) -> Optional[Replica]:
+        for replica in self.candidates():
+            if await replica.is_healthy_async():
+                return replica
+        return None
+
+    def stats(self) -> list:
+        return [replica.stats() for replica in self.replicas]
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.dispose()
+
+
+replica_pool = ReplicaPool(DB_REPLICA_URLS)
+
+def get_read_db():
+    """Сессия для безопасных чтений: реплика, а если все недоступны - primary.
+
+    Записи и чтение сразу после записи (корзина, заказы) идут через get_db.
+    """
+    replica = replica_pool.pick()
+    db = replica.session_factory() if replica else SessionLocal()
+    try:
+        yield db
+    except OperationalError as e:
+        if replica:
+            replica.mark_down(e)
+        raise
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    replica = await replica_pool.pick_async()
+    async with (replica.async_session_factory() if replica else AsyncSessionLocal()) as db:
+        try:
+            yield db
+        except OperationalError as e:
+            if replica:
+                replica.mark_down(e)
+            raise
+
+get_read_session = get_async_read_db if DB_ASYNC else get_read_db
+
+def read_session_factory() -> sessionmaker:
+    """Фабрика сессий для долгих выгрузок: здоровая реплика или primary"""
+    replica = replica_pool.pick()
+    return replica.session_factory if replica else SessionLocal
+
+async def run_db(db: AnySession, fn: Callable[..., T], *args, **kwargs) -> T:
+    """Вызывает fn(session, ...) из crud, не блокируя event loop.
+
+    AsyncSession выполняет функцию в greenlet поверх asyncpg, обычная сессия - в пуле потоков.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+def sync_session_factory(db: AsyncSession) -> sessionmaker:
+    """Синхронная фабрика сессий того же сервера (primary или реплика), что и у db"""
+    for replica in replica_pool.replicas:
+        if replica.async_engine is not None and db.bind is replica.async_engine:
+            return replica.session_factory
+    return SessionLocal
+
+async def run_cached(db: AnySession, fn: Callable[..., T], *args, **kwargs) -> T:
+    """Как run_db, но для функций, которые обращаются к кэшу каталога или сессий.
+
+    Клиент Redis синхронный, а AsyncSession.run_sync выполняет fn прямо в event loop.
+    Поэтому при кэше в Redis fn уходит в пул потоков с синхронной сессией того же сервера.
+    """
+    if isinstance(db, AsyncSession) and get_redis() is not None:
+        def call():
+            with sync_session_factory(db)() as session:
+                return fn(session, *args, **kwargs)
+        return await run_in_threadpool(call)
+    return await run_db(db, fn, *args, **kwargs)
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+    await replica_pool.dispose()
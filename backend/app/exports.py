@@ -0,0 +1,118 @@
+import csv
+import io
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Сколько строк забираем с серверного курсора за раз
+EXPORT_BATCH_SIZE = 1000
+
+PERFUME_EXPORT_COLUMNS = (
+    models.Perfume.id,
+    models.Perfume.name,
+    models.Perfume.brand,
+    models.Perfume.price,
+    models.Perfume.perfume_type,
+    models.Perfume.description,
+    models.Perfume.img_url,
+    models.Perfume.stock_quantity,
+    models.Perfume.volume,
+    models.Perfume.concentration,
+    models.Perfume.created_at,
+)
+
+ORDER_FIELDS = ("id", "user_id", "status", "total_amount", "created_at", "updated_at")
+ORDER_ITEM_FIELDS = ("item_id", "perfume_id", "quantity", "price")
+
+
+def _plain(value):
+    if isinstance(value, models.PerfumeType):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunk(rows: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _ndjson_chunk(records: list) -> bytes:
+    return b"".join(orjson.dumps(record) + b"\n" for record in records)
+
+
+def stream_perfumes(session_factory: Callable[[], Session], export_format: str) -> Iterator:
+    """Каталог целиком; в памяти одновременно только одна пачка строк"""
+    with session_factory() as db:
+        result = db.execute(
+            select(*PERFUME_EXPORT_COLUMNS)
+            .order_by(models.Perfume.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        keys = list(result.keys())
+        if export_format == "csv":
+            yield _csv_chunk([keys])
+        for partition in result.partitions():
+            if export_format == "csv":
+                yield _csv_chunk([[_plain(v) for v in row] for row in partition])
+            else:
+                yield _ndjson_chunk([{k: _plain(v) for k, v in zip(keys, row)} for row in partition])
+
+
+def stream_orders(
+        session_factory: Callable[[], Session],
+        export_format: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None) -> Iterator:
+    """Заказы с позициями за [since, until).
+
+    NDJSON - один заказ на строку с массивом items, CSV - одна строка на позицию.
+    """
+    query = (
+        select(
+            models.Order.id, models.Order.user_id, models.Order.status, models.Order.total_amount,
+            models.Order.created_at, models.Order.updated_at,
+            models.OrderItem.id, models.OrderItem.perfume_id, models.OrderItem.quantity, models.OrderItem.price,
+        )
+        .outerjoin(models.OrderItem, models.OrderItem.order_id == models.Order.id)
+        # Тот же порядок, что у индекса ix_orders_created_at_id; позиции заказа идут подряд
+        .order_by(models.Order.created_at, models.Order.id, models.OrderItem.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if since is not None:
+        query = query.where(models.Order.created_at >= since)
+    if until is not None:
+        query = query.where(models.Order.created_at < until)
+
+    with session_factory() as db:
+        result = db.execute(query)
+        if export_format == "csv":
+            yield _csv_chunk([ORDER_FIELDS + ORDER_ITEM_FIELDS])
+            for partition in result.partitions():
+                yield _csv_chunk([[_plain(v) for v in row] for row in partition])
+            return
+
+        # Заказ может оказаться на границе пачек - держим его, пока не придет следующий
+        current = None
+        for partition in result.partitions():
+            finished = []
+            for row in partition:
+                order, item = row[:len(ORDER_FIELDS)], row[len(ORDER_FIELDS):]
+                if current is None or current["id"] != order[0]:
+                    if current is not None:
+                        finished.append(current)
+                    current = {k: _plain(v) for k, v in zip(ORDER_FIELDS, order)}
+                    current["items"] = []
+                if item[0] is not None:
+                    current["items"].append(dict(zip(("id",) + ORDER_ITEM_FIELDS[1:], item)))
+            if finished:
+                yield _ndjson_chunk(finished)
+        if current is not None:
+            yield _ndjson_chunk([current])
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from .broker import check_health as check_broker
+from .database import async_engine, engine
+from .pool_metrics import pool_stats
+
+load_dotenv('.env')
+
+# Сколько секунд отдавать сохраненный результат: частые пробы оркестратора не нагружают базу и брокер
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "5"))
+# Дольше этого проверка считается неудачной - в том числе когда пул исчерпан
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+
+
+def _ping_database():
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+async def _ping_database_async():
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def check_database() -> bool:
+    try:
+        ping = _ping_database_async() if async_engine is not None else run_in_threadpool(_ping_database)
+        await asyncio.wait_for(ping, HEALTH_CHECK_TIMEOUT)
+        return True
+    except Exception as e:
+        print(f"❌ Database health check failed: {e!r}")
+        return False
+
+
+async def _check_broker() -> bool:
+    try:
+        return await asyncio.wait_for(check_broker(), HEALTH_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        print("❌ RabbitMQ health check timed out")
+        return False
+
+
+class HealthCheck:
+    """Последний результат проверки; параллельные пробы ждут одну проверку, а не запускают свои"""
+
+    def __init__(self, ttl: float = HEALTH_CACHE_TTL):
+        self.ttl = ttl
+        self._result: Optional[dict] = None
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    async def run(self) -> dict:
+        database_healthy, broker_healthy = await asyncio.gather(check_database(), _check_broker())
+        pool = async_engine.sync_engine.pool if async_engine is not None else engine.pool
+        return {
+            "status": "healthy" if database_healthy and broker_healthy else "degraded",
+            "database": "connected" if database_healthy else "disconnected",
+            "rabbitmq": "connected" if broker_healthy else "disconnected",
+            "database_pool": pool_stats(pool),
+            "checked_at": time.time(),
+        }
+
+    async def get(self) -> dict:
+        if time.monotonic() - self._checked_at < self.ttl:
+            return self._result
+        async with self._lock:
+            if time.monotonic() - self._checked_at >= self.ttl:
+                self._result = await self.run()
+                self._checked_at = time.monotonic()
+        return self._result
+
+
+health_check = HealthCheck()
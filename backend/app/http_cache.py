@@ -0,0 +1,44 @@
+import hashlib
+import os
+from typing import Optional
+
+import orjson
+from fastapi import Request, Response
+
+# Каталог публичный: браузер и прокси могут переиспользовать ответ, а потом
+# дешево перепроверить его по ETag
+CATALOG_CACHE_CONTROL = os.getenv(
+    "CATALOG_CACHE_CONTROL", "public, max-age=30, stale-while-revalidate=300"
+)
+
+
+def dump_json(payload) -> str:
+    """Сериализация без pydantic; результат кладется в кэш как есть"""
+    return orjson.dumps(payload).decode()
+
+
+def body_etag(*bodies: str) -> str:
+    """Сильный ETag от готового тела ответа; считается один раз при заполнении кэша"""
+    digest = hashlib.sha256()
+    for body in bodies:
+        digest.update(body.encode())
+        digest.update(b"\0")
+    return '"' + digest.hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def catalog_response(request: Request, body: str, etag: str, headers: dict = None) -> Response:
+    """Готовое тело из кэша или пустой 304, если у клиента та же версия"""
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
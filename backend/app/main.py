@@ -7,33 +7,60 @@ from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 
-from app.broker import check_health, close_broker, connect_broker
-from . import models
-from .database import engine
-from .routers import perfumes, orders, cart, users, uploads
+from app.broker import close_broker, connect_broker, delete_health_check_queue, subscribe_catalog_changes
+from app.cache import start_cache_listener, stop_cache_listener
+from app.health import health_check as cached_health_check
+from app.cart_sweeper import start_cart_sweeper, stop_cart_sweeper
+from app.outbox import start_outbox_dispatcher, stop_outbox_dispatcher
+from app.query_stats import QueryStatsMiddleware
+from . import crud, models
+from .database import dispose_engines, engine
+from .routers import perfumes, orders, cart, users, uploads, internal
 load_dotenv(".env")
 URL_FRONTEND_LOCAL = os.getenv('CORS_FRONTEND_LOCAL')
 URL_FRONTEND2 = os.getenv('CORS_ORIGINS2')
 URL_FRONTEND3 = os.getenv('CORS_ORIGINS3')
 URL_FRONTEND4 = os.getenv('CORS_ORIGINS4')
 
+async def on_catalog_changed(message: dict):
+    # Бот списал остатки при подтверждении заказа - без сброса кэш отдавал бы их до TTL
+    await run_in_threadpool(crud.invalidate_catalog)
+
+
 # Lifespan менеджер
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_broker()
     print("✅ RabbitMQ broker connected")
+    await subscribe_catalog_changes(on_catalog_changed)
+    # Очередь прежней проверки здоровья: в нее только писали, удаляем вместе с накопленным
+    await delete_health_check_queue()
 
     # Создаем таблицы БД
     models.Base.metadata.create_all(bind=engine)
     print("✅ Database tables created")
 
+    # Инвалидации кэша от других воркеров (если настроен Redis)
+    start_cache_listener()
+
+    # Фоновая чистка брошенных пустых корзин
+    start_cart_sweeper()
+
+    # Публикация событий из outbox_events в RabbitMQ
+    start_outbox_dispatcher()
+
     yield  # Здесь работает приложение
 
     # Shutdown
+    await stop_outbox_dispatcher()
+    await stop_cart_sweeper()
+    stop_cache_listener()
     await close_broker()
     print("✅ RabbitMQ broker disconnected")
+    await dispose_engines()
 
 
 app = FastAPI(
@@ -53,9 +80,13 @@ app.add_middleware(
     allow_origins=[URL_FRONTEND_LOCAL, URL_FRONTEND2, URL_FRONTEND3, URL_FRONTEND4,],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"]
 )
 
+# Число SQL-запросов и время в базе на каждый запрос - в заголовке Server-Timing
+app.add_middleware(QueryStatsMiddleware)
+
 # Роутеры
 prefix = "/api/v1"
 app.include_router(perfumes.router, prefix=prefix)
@@ -63,6 +94,7 @@ app.include_router(orders.router, prefix=prefix)
 app.include_router(cart.router, prefix=prefix)
 app.include_router(users.router, prefix=prefix)
 app.include_router(uploads.router, prefix=prefix)
+app.include_router(internal.router, prefix=prefix)
 
 
 @app.get("/")
@@ -71,9 +103,5 @@ def read_root():
 
 @app.get("/health")
 async def health_check():
-    broker_healthy = await check_health()
-    return {
-        "status": "healthy" if broker_healthy else "degraded",
-        "database": "connected",
-        "rabbitmq": "connected" if broker_healthy else "disconnected"
-    }
+    # Результат кэшируется на HEALTH_CACHE_TTL секунд
+    return await cached_health_check.get()
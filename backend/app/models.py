@@ -1,5 +1,5 @@
 from pydantic import EmailStr
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Enum, Index, DDL, event, UniqueConstraint, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -32,9 +32,39 @@ class Perfume(Base):
     volume = Column(Integer, default=50)
     concentration = Column(String(50), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Ключ upsert при импорте фидов поставщиков
+        UniqueConstraint("name", "brand", "volume", name="uq_perfumes_name_brand_volume"),
+        # Фильтры каталога: равенство по ведущей колонке + диапазон/сортировка по цене
+        Index("ix_perfumes_brand_price", "brand", "price", "id"),
+        Index("ix_perfumes_type_price", "perfume_type", "price", "id"),
+        Index("ix_perfumes_volume_price", "volume", "price", "id"),
+        Index("ix_perfumes_price", "price", "id"),
+        Index("ix_perfumes_created_at_id", "created_at", "id"),
+        # Частичный индекс под "только в наличии"
+        Index("ix_perfumes_in_stock_price", "price", "id", postgresql_where=stock_quantity > 0),
+        # Остатки: "мало на складе" в боте и списание по заказам
+        Index("ix_perfumes_stock_quantity", "stock_quantity"),
+    )
     # INSERT INTO perfumes (name, brand, price, perfume_type, description, stock_quantity, volume, concentration, )
     # VALUES('DUH', 'BRAND', 5000, 'fresh', 'AHUENNIE OTVECHAU', 10, 50, 'idf');
 
+# Полнотекстовый поиск есть только в Postgres: search_vector не маппится в модель,
+# к нему обращаются только запросы поиска. Для create_all повторяем миграцию.
+PERFUME_SEARCH_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE perfumes ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(brand, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_perfumes_search_vector ON perfumes USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_perfumes_name_trgm ON perfumes USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_perfumes_brand_trgm ON perfumes USING gin (brand gin_trgm_ops)",
+)
+for statement in PERFUME_SEARCH_DDL:
+    event.listen(Perfume.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -48,6 +78,14 @@ class Order(Base):
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     user = relationship("User", back_populates="orders")
 
+    __table_args__ = (
+        # Для keyset-пагинации списка заказов и "последних заказов" в боте
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_user_id", "user_id"),
+        # Счетчики бота по статусам; сумма выручки читается прямо из индекса
+        Index("ix_orders_status", "status", postgresql_include=["total_amount"]),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
@@ -60,6 +98,11 @@ class OrderItem(Base):
     order = relationship("Order", back_populates="items")
     perfume = relationship("Perfume")
 
+    __table_args__ = (
+        # selectinload(Order.items) и обработчик заказов ищут позиции по order_id
+        Index("ix_order_items_order_id", "order_id"),
+    )
+
 class Cart(Base):
     __tablename__ = "carts"
 
@@ -67,10 +110,17 @@ class Cart(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Увеличивается каждым изменением корзины
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     # Связь с элементами заказа
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan")
     user = relationship("User", back_populates="carts")
 
+    __table_args__ = (
+        # Одна корзина на пользователя - ключ upsert при добавлении товара
+        UniqueConstraint("user_id", name="uq_carts_user_id"),
+    )
+
 class CartItem(Base):
     __tablename__ = "cart_items"
 
@@ -82,6 +132,31 @@ class CartItem(Base):
     cart = relationship("Cart", back_populates="items")
     perfume = relationship("Perfume")
 
+    __table_args__ = (
+        # Один духи - одна строка в корзине; индекс покрывает и поиск по cart_id
+        UniqueConstraint("cart_id", "perfume_id", name="uq_cart_items_cart_perfume"),
+    )
+
+class OutboxEvent(Base):
+    """Сообщение для RabbitMQ, записанное в одной транзакции с изменением данных.
+
+    Диспетчер (app/outbox.py) публикует строки и удаляет их после подтверждения брокера.
+    """
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True)
+    queue = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Раньше этого момента строку не берут: аренда диспетчером или пауза перед повтором
+    available_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_events_available_at", "available_at", "id"),
+    )
+
 class User(Base):
     __tablename__ = "users"
 
@@ -92,6 +167,8 @@ class User(Base):
     role = Column(String(20), default="customer")  # customer, admin
     hashed_password = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Версия последней удаленной корзины: новая корзина продолжает счет, а не начинает с 1
+    cart_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     orders = relationship("Order", back_populates="user", cascade="all, delete-orphan")
     carts = relationship("Cart", back_populates="user", cascade="all, delete-orphan")
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from . import crud
+from .broker import async_client
+from .database import SessionLocal
+
+load_dotenv('.env')
+
+# Сколько событий публиковать за один проход
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "100"))
+# Как часто проверять таблицу, если никто не разбудил диспетчер, сек
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+# Сколько секунд взятая строка скрыта от других воркеров; должно хватать на публикацию пачки
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "60"))
+# Потолок паузы между повторами; растет как 2^попытка
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+
+# (очередь, сообщения, message_id) -> подтвержден ли каждый
+PublishBatch = Callable[[str, List[dict], List[str]], Awaitable[List[bool]]]
+
+
+async def publish_events(queue: str, payloads: List[dict], message_ids: List[str]) -> List[bool]:
+    return await async_client.publish_batch(queue, payloads, message_ids)
+
+
+def retry_delay(attempts: int) -> float:
+    return min(OUTBOX_MAX_BACKOFF, 2.0 ** attempts)
+
+
+class OutboxDispatcher:
+    """Переносит события из outbox_events в RabbitMQ.
+
+    Строка удаляется только после подтверждения брокера, поэтому при падении
+    воркера или истекшей аренде событие уйдет повторно. Обработчик заказов в боте
+    (tg_bot/app/order_processor.py) идемпотентен: заказ обрабатывается только пока
+    у него начальный статус, повтор ничего не меняет.
+    """
+
+    def __init__(self, publish: PublishBatch = publish_events, session_factory=SessionLocal):
+        self.publish = publish
+        self.session_factory = session_factory
+        self.published = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+        self.last_published_at: Optional[float] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _claim(self) -> list:
+        with self.session_factory() as db:
+            return crud.claim_outbox_events(db, OUTBOX_BATCH, OUTBOX_LEASE)
+
+    def _finish(self, published: list, failed: dict):
+        with self.session_factory() as db:
+            if published:
+                crud.complete_outbox_events(db, published)
+            for (attempts, error), event_ids in failed.items():
+                crud.retry_outbox_events(db, event_ids, retry_delay(attempts), error)
+
+    async def dispatch_once(self) -> int:
+        """Одна пачка: взять, опубликовать, удалить подтвержденные. Возвращает размер пачки"""
+        events = await run_in_threadpool(self._claim)
+        if not events:
+            return 0
+        by_queue = {}
+        for event in events:
+            by_queue.setdefault(event.queue, []).append(event)
+        # Пачка на очередь; подтверждения внутри пачки ждутся вместе
+        batches = await asyncio.gather(
+            *(self.publish(queue, [event.payload for event in queue_events], [str(event.id) for event in queue_events])
+              for queue, queue_events in by_queue.items()),
+            return_exceptions=True
+        )
+        results = {}
+        for queue_events, confirmed in zip(by_queue.values(), batches):
+            if isinstance(confirmed, BaseException):
+                confirmed = [confirmed] * len(queue_events)
+            results.update({event.id: result for event, result in zip(queue_events, confirmed)})
+
+        published, failed = [], {}
+        for event in events:
+            result = results[event.id]
+            if result is True:
+                published.append(event.id)
+                continue
+            error = repr(result) if isinstance(result, BaseException) else "Broker did not confirm the message"
+            # Паузу считаем по числу попыток, поэтому группируем по нему
+            failed.setdefault((event.attempts, error), []).append(event.id)
+        await run_in_threadpool(self._finish, published, failed)
+
+        self.batches += 1
+        self.published += len(published)
+        if published:
+            self.last_published_at = time.time()
+        if failed:
+            self.failed += len(events) - len(published)
+            self.last_error = next(iter(failed))[1]
+            print(f"❌ Outbox: {len(events) - len(published)} of {len(events)} events not published: {self.last_error}")
+        return len(events)
+
+    async def run(self):
+        while True:
+            try:
+                claimed = await self.dispatch_once()
+            except Exception as e:
+                print(f"❌ Outbox dispatcher failed: {e}")
+                claimed = 0
+            if claimed == OUTBOX_BATCH:
+                # Полная пачка - в таблице, скорее всего, есть еще
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def wake(self):
+        """Новое событие в этом процессе: публикуем сразу, не дожидаясь опроса"""
+        self._wake.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_error": self.last_error,
+            "last_published_at": self.last_published_at,
+        }
+
+
+dispatcher = OutboxDispatcher()
+
+
+def start_outbox_dispatcher():
+    dispatcher.start()
+
+
+async def stop_outbox_dispatcher():
+    await dispatcher.stop()
+
+
+def notify_outbox():
+    dispatcher.wake()
@@ -0,0 +1,35 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или выдан для другого списка"""
+
+
+def encode_cursor(kind: str, *values) -> str:
+    """Упаковываем ключ последней строки страницы в непрозрачную строку"""
+    payload = [kind] + [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, size: int) -> list:
+    """Распаковываем курсор и проверяем, что он относится к нужному списку"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError("Invalid cursor")
+
+    if not isinstance(payload, list) or len(payload) != size + 1 or payload[0] != kind:
+        raise InvalidCursorError("Invalid cursor")
+    return payload[1:]
+
+
+def parse_cursor_datetime(value) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidCursorError("Invalid cursor")
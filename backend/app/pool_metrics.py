@@ -0,0 +1,109 @@
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool
+
+# Верхние границы корзин гистограммы ожидания соединения, мс
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolMetrics:
+    """Сколько запросы ждали соединения из пула, сколько не дождались и сколько открывались новые.
+
+    Ожидание - время в очереди пула без открытия соединения, поэтому холодный старт
+    виден в connect_*, а не выглядит как нехватка соединений.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.connects = 0
+        self.connect_total_ms = 0.0
+        self.connect_max_ms = 0.0
+        # Последняя корзина - все, что дольше WAIT_BUCKETS_MS[-1]
+        self.buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_wait(self, wait_ms: float):
+        index = next((i for i, bound in enumerate(WAIT_BUCKETS_MS) if wait_ms <= bound), len(WAIT_BUCKETS_MS))
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            self.buckets[index] += 1
+
+    def record_connect(self, connect_ms: float):
+        with self._lock:
+            self.connects += 1
+            self.connect_total_ms += connect_ms
+            self.connect_max_ms = max(self.connect_max_ms, connect_ms)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            labels = [f"le_{bound}ms" for bound in WAIT_BUCKETS_MS] + ["inf"]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 3),
+                "wait_histogram": dict(zip(labels, self.buckets)),
+                "connects": self.connects,
+                "connect_avg_ms": round(self.connect_total_ms / self.connects, 3) if self.connects else 0.0,
+                "connect_max_ms": round(self.connect_max_ms, 3),
+            }
+
+
+class InstrumentedPoolMixin:
+    """Замеряет ожидание соединения и открытие новых; metrics задается в подклассе"""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout()
+            raise
+        # Открытие нового соединения внутри _do_get - не ожидание, из времени его вычитаем
+        connect_ms = record.__dict__.pop("_connect_ms", 0.0)
+        self.metrics.record_wait(max(0.0, (time.perf_counter() - started) * 1000 - connect_ms))
+        return record
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        record = super()._create_connection()
+        record._connect_ms = (time.perf_counter() - started) * 1000
+        self.metrics.record_connect(record._connect_ms)
+        return record
+
+
+def instrumented_pool_class(base: type, metrics: PoolMetrics) -> type:
+    # Метрики живут в классе, а не в экземпляре: engine.dispose() пересоздает пул через self.__class__
+    return type(f"Instrumented{base.__name__}", (InstrumentedPoolMixin, base), {"metrics": metrics})
+
+
+def pool_stats(pool: Pool) -> dict:
+    """Текущее состояние пула и накопленные метрики ожидания"""
+    stats = {"pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # Отрицательное значение - пул еще не открыл даже базовые соединения
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.stats())
+    return stats
@@ -0,0 +1,110 @@
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Одинаковый SQL столько раз за запрос - почти наверняка N+1
+QUERY_REPEAT_WARNING = int(os.getenv("QUERY_REPEAT_WARNING", "5"))
+
+
+class QueryStats:
+    """Запросы к базе в рамках одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, duration_ms: float):
+        self.count += 1
+        self.duration_ms += duration_ms
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int = QUERY_REPEAT_WARNING) -> list:
+        return [(statement, count) for statement, count in self.statements.items() if count >= threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration_ms:.1f};desc="{self.count} queries"'
+
+
+# Объект общий для копий контекста: пул потоков и run_sync пишут в тот же счетчик
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats.get()
+    started_at = getattr(context, "query_started_at", None)
+    if stats is not None and started_at is not None:
+        stats.record(statement, (time.perf_counter() - started_at) * 1000)
+
+
+def instrument_engine(engine: Engine):
+    """Подключает счетчик к движку; для AsyncEngine передавайте engine.sync_engine"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def collect_queries() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class QueryStatsMiddleware:
+    """Считает SQL на каждый запрос и отдает итог в заголовке Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with collect_queries() as stats:
+            async def send_with_timing(message):
+                # Для потоковых ответов учтены только запросы до первого байта
+                if message["type"] == "http.response.start":
+                    message.setdefault("headers", []).append((b"server-timing", stats.server_timing().encode()))
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+        for statement, count in stats.repeated():
+            print(f"⚠️ Possible N+1 in {scope['method']} {scope['path']}: {count}x {' '.join(statement.split())[:200]}")
+
+
+@contextmanager
+def query_budget(engine: Engine, max_queries: int) -> Iterator[list]:
+    """Для тестов: падает, если внутри блока к engine ушло больше max_queries запросов.
+
+    Слушает сам движок, а не контекст, поэтому работает и через TestClient.
+    """
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "after_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "after_cursor_execute", count)
+    assert len(statements) <= max_queries, (
+        f"Query budget exceeded: {len(statements)} > {max_queries}\n" + "\n".join(statements)
+    )
@@ -1,43 +1,60 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 
+from .orders import order_contacts
 from .users import get_current_user
-from ..database import get_db
+from ..database import AnySession, get_session, run_db
+from ..outbox import notify_outbox
 from .. import crud, schemas, models
 
 router = APIRouter(prefix="/cart", tags=["cart"])
 
 @router.post("/", response_model=schemas.CartResponse)
-def add_to_cart(
+async def add_to_cart(
         cart_item: schemas.CartItemCreate,
         current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AnySession = Depends(get_session)
     ):
     user_id = current_user.id
     # Создаем заказ
-    db_cart = crud.add_to_cart(db=db, user_id=user_id, item_data=cart_item)
+    db_cart = await run_db(db, crud.add_to_cart, user_id=user_id, item_data=cart_item)
     print(db_cart)
 
     return db_cart
 
 
 @router.get("/", response_model=schemas.CartResponse)
-def get_user_cart(
+async def get_user_cart(
         current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)):
+        db: AnySession = Depends(get_session)):
     print("get_cart")
-    cart = crud.get_cart_items(db, user_id=current_user.id)
+    cart = await run_db(db, crud.get_cart_items, user_id=current_user.id)
+
+    return cart
+
+@router.patch("/", response_model=schemas.CartResponse)
+async def patch_cart(
+        patch: schemas.CartPatch,
+        current_user: models.User = Depends(get_current_user),
+        db: AnySession = Depends(get_session)):
+    # Все операции одной транзакцией, в ответе итоговая корзина с новой версией
+    try:
+        cart = await run_db(db, crud.apply_cart_operations,
+                                    user_id=current_user.id,
+                                    operations=patch.operations)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Perfume not found")
 
     return cart
 
 @router.put("/{perfume_id}", response_model=schemas.CartResponse)
-def update_quantity(
+async def update_quantity(
         perfume_id: int,
         cart_item: schemas.CartItemUpdate,
         current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)):
+        db: AnySession = Depends(get_session)):
     print("get_cart")
-    cart = crud.update_perfume_quantity(db,
+    cart = await run_db(db, crud.update_perfume_quantity,
                                         user_id=current_user.id,
                                         perfume_id=perfume_id,
                                         quantity=cart_item.quantity)
@@ -47,11 +64,11 @@ def update_quantity(
     return cart
 
 @router.delete("/{perfume_id}", response_model=schemas.CartResponse)
-def delete_item(
+async def delete_item(
         perfume_id: int,
         current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)):
-    cart = crud.remove_item_from_cart(db,
+        db: AnySession = Depends(get_session)):
+    cart = await run_db(db, crud.remove_item_from_cart,
                                 user_id=current_user.id,
                                 perfume_id=perfume_id)
     if not cart:
@@ -60,12 +77,25 @@ def delete_item(
     return cart
 
 @router.delete("/", response_model=schemas.CartResponse)
-def delete_all_after_order(
+async def delete_all_after_order(
         current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)):
-    cart = crud.remove_from_cart(db,
+        db: AnySession = Depends(get_session)):
+    cart = await run_db(db, crud.remove_from_cart,
                                 user_id=current_user.id)
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
 
     return cart
+
+@router.post("/checkout", response_model=schemas.OrderResponse)
+async def checkout(
+        current_user: models.User = Depends(get_current_user),
+        db: AnySession = Depends(get_session)):
+    # Цены берутся из каталога, а не от клиента; корзина очищается, а событие
+    # для бота пишется в outbox в той же транзакции
+    order = await run_db(db, crud.checkout_cart, user_id=current_user.id, contacts=order_contacts(current_user))
+    if not order:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    notify_outbox()
+
+    return order
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends
+
+from .. import crud
+from ..cache import catalog_cache, session_cache
+from ..database import AnySession, async_engine, engine, get_session, replica_pool, run_db
+from ..outbox import dispatcher
+from ..pool_metrics import pool_stats
+
+# Служебные метрики; снаружи закрываются на уровне прокси
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+@router.get("/cache")
+def cache_stats():
+    return {"catalog": catalog_cache.stats(), "sessions": session_cache.stats()}
+
+@router.get("/pool")
+def db_pool_stats():
+    # Рост timeouts и хвоста гистограммы ожидания - пулу не хватает соединений
+    return {
+        "sync": pool_stats(engine.pool),
+        "async": pool_stats(async_engine.sync_engine.pool) if async_engine is not None else None,
+        "replicas": replica_pool.stats(),
+    }
+
+@router.get("/outbox")
+async def outbox_stats(db: AnySession = Depends(get_session)):
+    # lag_seconds - возраст самого старого неотправленного события; растет, когда брокер недоступен
+    return {**await run_db(db, crud.outbox_lag), "dispatcher": dispatcher.stats()}
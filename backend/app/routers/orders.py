@@ -1,56 +1,90 @@
-from fastapi import APIRouter, Depends, BackgroundTasks, Request
-from faststream import response
-from sqlalchemy.orm import Session
-from typing import List
-import pika
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Request, Response, Query, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 
-from app.broker import publish_order
 from .users import get_current_user
-from ..database import get_db
+from ..database import AnySession, get_read_session, get_session, read_session_factory, run_db
+from ..exports import stream_orders
+from ..outbox import notify_outbox
 from .. import crud, schemas, models
+from ..pagination import InvalidCursorError
 from ..schemas import OrderItemResponse
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
-connection_params = pika.ConnectionParameters(
-    host="localhost",
-    port=5672
-)
-
-def send_order_notification(order_data: dict):
-    """Отправка уведомления в RabbitMQ через брокер"""
-    # Используем функцию из брокера вместо прямого pika
-    print("send_order_noti")
-    publish_order(order_data)
-
 @router.post("/", response_model=schemas.OrderResponse)
-def create_order(
+async def create_order(
         order: schemas.OrderCreate,
-        background_tasks: BackgroundTasks,
         current_user: models.User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AnySession = Depends(get_session)
 ):
-    # Создаем заказ
-    user_id = current_user.id
-    db_order = crud.create_order(db=db, order=order, user_id=user_id)
-    print(db_order)
-    # Отправляем уведомление в фоне
-    order_data = {
+    # Заказ и событие для бота сохраняются одной транзакцией, в RabbitMQ его отправит диспетчер outbox
+    db_order = await run_db(db, crud.create_order, order=order, user_id=current_user.id,
+                            contacts=order_contacts(current_user))
+    notify_outbox()
+
+    return {
         "id": db_order.id,
         "status": db_order.status,
         "total_amount": db_order.total_amount,
         "telegram_username": current_user.telegram_username,
         "user_email": current_user.email,
-        "items": [{"id": db_order.id, "perfume_id": item.perfume_id, "quantity": item.quantity, "price": item.price} for item in order.items]
+        "items": db_order.items
     }
-    print(order_data)
-    print("отправляем уведомление в фоне")
-    background_tasks.add_task(send_order_notification, order_data)
 
-    return order_data
 
+def order_contacts(user: models.User) -> dict:
+    return {"telegram_username": user.telegram_username, "user_email": user.email}
+
+
+def is_admin(user: models.User) -> bool:
+    return user.role == "admin"
+
+
+def order_to_response(order: models.Order) -> dict:
+    return {
+        "id": order.id,
+        "status": order.status,
+        "total_amount": order.total_amount,
+        "telegram_username": order.user.telegram_username if order.user else None,
+        "user_email": order.user.email if order.user else None,
+        "items": order.items
+    }
 
 @router.get("/", response_model=List[schemas.OrderResponse])
-def read_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    orders = crud.get_orders(db, skip=skip, limit=limit)
-    return orders
+async def read_orders(
+        response: Response,
+        skip: int = 0,
+        limit: int = Query(100, ge=1),
+        after: Optional[str] = None,
+        current_user: models.User = Depends(get_current_user),
+        db: AnySession = Depends(get_read_session)):
+    # after - курсор из X-Next-Cursor, skip оставлен для старых клиентов.
+    # В ответе контакты покупателя, поэтому покупатель видит только свои заказы
+    user_id = None if is_admin(current_user) else current_user.id
+    try:
+        orders = await run_db(db, crud.get_orders, skip=skip, limit=limit, after=after, user_id=user_id)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(orders) == limit:
+        response.headers["X-Next-Cursor"] = crud.order_cursor(orders[-1])
+    return [order_to_response(order) for order in orders]
+
+
+@router.get("/export")
+def export_orders(
+        export_format: str = Query("ndjson", alias="format", pattern="^(csv|ndjson)$"),
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        current_user: models.User = Depends(get_current_user)):
+    # Заказы за [since, until) вместе с позициями, потоком с серверного курсора
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin only")
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_orders(read_session_factory(), export_format, since=since, until=until),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{export_format}"'}
+    )
@@ -1,29 +1,131 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from ..database import get_db
+from ..database import AnySession, get_db, get_read_session, get_session, read_session_factory, run_cached, run_db
 from .. import crud, schemas, models
+from ..catalog_import import detect_format, import_perfumes
+from ..exports import stream_perfumes
+from ..http_cache import body_etag, catalog_response, dump_json
+from ..pagination import InvalidCursorError
 
 router = APIRouter(prefix="/perfumes", tags=["perfumes"])
 
+# Списки и карточка отдаются готовыми JSON-телами из кэша каталога;
+# response_model оставлен для документации OpenAPI
 @router.get("/", response_model=List[schemas.PerfumeResponse])
-def read_perfumes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    perfumes = crud.get_perfumes(db, skip=skip, limit=limit)
-    return perfumes
+async def read_perfumes(
+        request: Request,
+        skip: int = Query(0, ge=0),
+        limit: int = Query(100, ge=1, le=100),
+        after: Optional[str] = None,
+        db: AnySession = Depends(get_read_session)):
+    # after - курсор из X-Next-Cursor, skip оставлен для старых клиентов.
+    # Каждая страница кэшируется, поэтому размер ограничен, как у /catalog
+    try:
+        page = await run_cached(db, crud.cached_perfumes, skip=skip, limit=limit, after=after)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = {"X-Next-Cursor": page["next_cursor"]} if page["next_cursor"] else None
+    return catalog_response(request, page["items_json"], page["etag"], headers)
+
+@router.get("/catalog", response_model=schemas.CatalogPage)
+async def read_catalog(
+        request: Request,
+        brand: List[str] = Query([]),
+        perfume_type: List[models.PerfumeType] = Query([]),
+        min_price: Optional[float] = Query(None, ge=0),
+        max_price: Optional[float] = Query(None, ge=0),
+        volume: List[int] = Query([]),
+        in_stock: bool = False,
+        sort: schemas.CatalogSort = schemas.CatalogSort.ID,
+        limit: int = Query(24, ge=1, le=100),
+        after: Optional[str] = None,
+        facets: bool = False,
+        db: AnySession = Depends(get_read_session)):
+    filters = schemas.CatalogFilters(
+        brands=brand,
+        perfume_types=perfume_type,
+        min_price=min_price,
+        max_price=max_price,
+        volumes=volume,
+        in_stock=in_stock
+    )
+    try:
+        page = await run_cached(db, crud.cached_catalog, filters, sort=sort, limit=limit, after=after)
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    facet_counts = await run_cached(db, crud.cached_catalog_facets, filters) if facets else None
+    facets_json = facet_counts["facets_json"] if facet_counts else "null"
+    etag = body_etag(page["etag"], facet_counts["etag"]) if facet_counts else page["etag"]
+    # Склеиваем закэшированные куски, не разбирая их обратно
+    body = (f'{{"items":{page["items_json"]},"next_cursor":{dump_json(page["next_cursor"])},'
+            f'"facets":{facets_json}}}')
+    return catalog_response(request, body, etag)
+
+# Ограничение на размер пачки, чтобы IN-список и ответ оставались небольшими
+MAX_BATCH_IDS = 100
+
+@router.get("/batch", response_model=schemas.PerfumeBatch)
+async def read_perfumes_batch(
+        request: Request,
+        ids: str = Query(..., pattern=r"^\d+(,\d+)*$", description="Comma-separated perfume ids"),
+        db: AnySession = Depends(get_read_session)):
+    # Порядок как в запросе, повторы убираем
+    perfume_ids = list(dict.fromkeys(int(perfume_id) for perfume_id in ids.split(",")))
+    if len(perfume_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+
+    entries = await run_cached(db, crud.cached_perfumes_by_ids, perfume_ids)
+    found = [entries[perfume_id] for perfume_id in perfume_ids if entries[perfume_id]["item_json"] is not None]
+    missing = [perfume_id for perfume_id in perfume_ids if entries[perfume_id]["item_json"] is None]
+    body = f'{{"items":[{",".join(entry["item_json"] for entry in found)}],"missing":{dump_json(missing)}}}'
+    etag = body_etag(dump_json(perfume_ids), *(entries[perfume_id]["etag"] for perfume_id in perfume_ids))
+    return catalog_response(request, body, etag)
+
+@router.get("/search", response_model=List[schemas.PerfumeResponse])
+async def search_perfumes(
+        q: str = Query(..., min_length=1, max_length=100),
+        limit: int = Query(20, ge=1, le=100),
+        db: AnySession = Depends(get_read_session)):
+    return await run_db(db, crud.search_perfumes, q=q.strip(), limit=limit)
+
+@router.get("/export")
+def export_perfumes(export_format: str = Query("ndjson", alias="format", pattern="^(csv|ndjson)$")):
+    # Генератор открывает свою сессию (на реплике, если есть) и читает серверным курсором пачками
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_perfumes(read_session_factory(), export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="perfumes.{export_format}"'}
+    )
 
 @router.get("/{perfume_id}", response_model=schemas.PerfumeResponse)
-def read_perfume(perfume_id: int, db: Session = Depends(get_db)):
-    perfume = crud.get_perfume(db, perfume_id=perfume_id)
-    if perfume is None:
+async def read_perfume(perfume_id: int, request: Request, db: AnySession = Depends(get_read_session)):
+    perfume = await run_cached(db, crud.cached_perfume, perfume_id=perfume_id)
+    if perfume["item_json"] is None:
         raise HTTPException(status_code=404, detail="Perfume not found")
-    return perfume
+    return catalog_response(request, perfume["item_json"], perfume["etag"])
 
 @router.post("/", response_model=schemas.PerfumeResponse)
-def create_perfume(perfume: schemas.PerfumeCreate, db: Session = Depends(get_db)):
-    return crud.create_perfume(db=db, perfume=perfume)
+async def create_perfume(perfume: schemas.PerfumeCreate, db: AnySession = Depends(get_session)):
+    return await run_cached(db, crud.create_perfume, perfume=perfume)
+
+@router.post("/import", response_model=schemas.ImportReport)
+def import_catalog(
+        file: UploadFile = File(...),
+        file_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$"),
+        db: Session = Depends(get_db)):
+    # Массовая загрузка остается синхронной: построчное чтение файла тоже блокирующее.
+    # Файл читается построчно из временного файла загрузки, чанками по 1000 строк
+    file_format = file_format or detect_format(file.filename, file.content_type)
+    if file_format is None:
+        raise HTTPException(status_code=400, detail="Unknown file format, pass ?format=csv or ?format=ndjson")
+    return import_perfumes(db, file.file, file_format)
 
 @router.delete("/{perfume_id}", response_model=schemas.PerfumeResponse)
-def create_perfume(perfume_id:int, db: Session = Depends(get_db)):
+async def create_perfume(perfume_id:int, db: AnySession = Depends(get_session)):
 
-    return crud.delete_perfume(db=db, perfume_id=perfume_id)
\ No newline at end of file
+    return await run_cached(db, crud.delete_perfume, perfume_id=perfume_id)
\ No newline at end of file
@@ -1,12 +1,13 @@
 import json
 
 from fastapi import APIRouter, Depends, Request, HTTPException, Response
+from starlette.concurrency import run_in_threadpool
 
 from sqlalchemy.orm import Session
 
 from app import schemas, crud, models
-from app.database import get_db
-from app.session_manager import get_user_id_from_session, create_session, delete_session
+from app.database import AnySession, get_session, run_cached, run_db
+from app.session_manager import get_user_id, create_session, delete_session
 
 router = APIRouter(prefix="/auth", tags=["register"])
 
@@ -20,28 +21,30 @@ def get_user_by_id(db: Session, user_id: int) -> models.User:
         return user_info
     return None
 
-def get_current_user(request: Request, db: Session = Depends(get_db)):
+async def get_current_user(request: Request, db: AnySession = Depends(get_session)):
     token = request.cookies.get("session_token")
     print(f"token from get_current_user: {token}")
-    user_id = get_user_id_from_session(db, token)
+    user_id = await get_user_id(db, token)
     print(f"current user: {user_id}")
     if not user_id:
         raise HTTPException(status_code=401, detail="Not auth")
-    user_info = get_user_by_id(db, user_id)
+    user_info = await run_db(db, get_user_by_id, user_id)
     return user_info
 
 @router.post("/register", response_model=schemas.AuthResponse)
-def create_user(
+async def create_user(
         user: schemas.UserRegister,
         response: Response,
-        db: Session = Depends(get_db)):
-    existing_user = crud.get_user_by_email_or_us(db, user.username, '')
+        db: AnySession = Depends(get_session)):
+    existing_user = await run_db(db, crud.get_user_by_email_or_us, user.username, '')
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
 
-    db_user = crud.create_user(db, user)
+    # bcrypt считаем в пуле потоков, чтобы не держать event loop
+    hashed_password = (await run_in_threadpool(crud.hash_password, user.password)).decode('utf-8')
+    db_user = await run_db(db, crud.create_user, user, hashed_password)
     print(f"dp_user {db_user}")
-    token = create_session(db, db_user.id)
+    token = await run_db(db, create_session, db_user.id)
     print(f"token {token}")
 
     user = schemas.AuthResponse(
@@ -65,7 +68,7 @@ def create_user(
     return user
 
 @router.get("/me", response_model=schemas.UserResponse)
-def get_user(
+async def get_user(
     current_user: models.User = Depends(get_current_user)):
     print(f"/me current_user: {current_user}")
     user = {
@@ -79,18 +82,19 @@ def get_user(
     return user
 
 @router.post("/login", response_model=schemas.AuthResponse)
-def login(
+async def login(
         user: schemas.UserLogin,
         response: Response,
-        db: Session = Depends(get_db)):
+        db: AnySession = Depends(get_session)):
 
     print(f"login: {user.email}")
-    existing_user = crud.get_user_by_email_or_us(db, '', user.email)
+    existing_user = await run_db(db, crud.get_user_by_email_or_us, '', user.email)
 
-    if not existing_user or not crud.verify_password(user.password, existing_user.hashed_password):
+    if not existing_user or not await run_in_threadpool(
+            crud.verify_password, user.password, existing_user.hashed_password):
         raise HTTPException(status_code=401, detail="Wrong username or password")
 
-    token = create_session(db, existing_user.id)
+    token = await run_db(db, create_session, existing_user.id)
     print(f"token: {token}")
     user = schemas.AuthResponse(
         id=existing_user.id,
@@ -113,15 +117,15 @@ def login(
     return user
 
 @router.post("/logout", response_model=schemas.UserResponse)
-def logout(
+async def logout(
         request: Request,
         response: Response,
-        db: Session = Depends(get_db)):
+        db: AnySession = Depends(get_session)):
 
     token = request.cookies.get("session_token")
 
     if token:
-        delete_session(db, token)
+        await run_cached(db, delete_session, token)
         response.delete_cookie("session_token")
 
     return {"message": "success"}
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field, validator, field_validator
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field, validator, field_validator, model_validator
+from typing import Dict, List, Optional
 from datetime import datetime
+import enum
 
 from app.models import PerfumeType
 
@@ -20,6 +21,24 @@ class PerfumeBase(BaseModel):
 class PerfumeCreate(PerfumeBase):
     pass
 
+class PerfumeImport(PerfumeCreate):
+    # При импорте id назначает база, строки сопоставляются по (name, brand, volume)
+    id: Optional[int] = None
+    # Часть ключа сопоставления: без объема строка попала бы в чужую позицию с volume=0
+    volume: int
+
+class ImportRowError(BaseModel):
+    line: int
+    errors: List[str]
+
+class ImportReport(BaseModel):
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+
 class PerfumeResponse(PerfumeBase):
     id: int
     created_at: datetime
@@ -27,9 +46,38 @@ class PerfumeResponse(PerfumeBase):
     class Config:
         from_attributes = True
 
+class CatalogSort(str, enum.Enum):
+    ID = "id"
+    PRICE_ASC = "price_asc"
+    PRICE_DESC = "price_desc"
+    NEWEST = "newest"
+    NAME = "name"
+
+class CatalogFilters(BaseModel):
+    brands: List[str] = []
+    perfume_types: List[PerfumeType] = []
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    volumes: List[int] = []
+    in_stock: bool = False
+
+class CatalogFacets(BaseModel):
+    brands: Dict[str, int]
+    perfume_types: Dict[str, int]
+
+class CatalogPage(BaseModel):
+    items: List[PerfumeResponse]
+    next_cursor: Optional[str] = None
+    facets: Optional[CatalogFacets] = None
+
+class PerfumeBatch(BaseModel):
+    items: List[PerfumeResponse]
+    missing: List[int]
+
 class CartItemCreate(BaseModel):
     perfume_id: int
-    quantity: int = 1
+    # Прибавляется к количеству в корзине - отрицательное значение уменьшило бы его ниже нуля
+    quantity: int = Field(1, gt=0, description="Quantity must be greater than 0")
 
 class CartItemResponse(BaseModel):
     id: int
@@ -41,9 +89,12 @@ class CartItemResponse(BaseModel):
         from_attributes = True
 
 class CartResponse(BaseModel):
-    id: int
+    # None - корзина еще не создана (пользователь ничего не добавлял)
+    id: Optional[int] = None
     user_id: int
     items: List[CartItemResponse]
+    # Растет при каждом изменении: совпала с известной клиенту - перерисовывать нечего
+    version: int = 0
 
     class Config:
         from_attributes = True
@@ -51,11 +102,32 @@ class CartResponse(BaseModel):
 class CartItemUpdate(BaseModel):
     quantity: int = Field(gt=0, description="Quantity must be greater than 0")
 
+class CartOperationType(str, enum.Enum):
+    SET = "set"
+    ADD = "add"
+    REMOVE = "remove"
+
+class CartOperation(BaseModel):
+    op: CartOperationType
+    perfume_id: int
+    # set - итоговое количество (0 удаляет позицию), add - сколько прибавить, remove - не нужно
+    quantity: int = Field(1, ge=0)
+
+    @model_validator(mode="after")
+    def check_quantity(self):
+        if self.op == CartOperationType.ADD and self.quantity < 1:
+            raise ValueError("Quantity to add must be greater than 0")
+        return self
+
+class CartPatch(BaseModel):
+    # Применяются по порядку, одной транзакцией
+    operations: List[CartOperation] = Field(min_length=1, max_length=100)
+
 # Order Schemas
 class OrderItemCreate(BaseModel):
     perfume_id: int
-    quantity: int
-    price: int
+    quantity: int = Field(gt=0)
+    price: int = Field(ge=0)
 
 class OrderCreate(BaseModel):
     status:  Optional[str] = "Created"
@@ -76,8 +148,8 @@ class OrderResponse(BaseModel):
     id: int
     status: str
     total_amount: float
-    telegram_username: str
-    user_email: str
+    telegram_username: Optional[str] = None
+    user_email: Optional[str] = None
     items: List[OrderItemResponse]
 
 # Для создания пользователя (без id, без пароля)
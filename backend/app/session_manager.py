@@ -1,7 +1,10 @@
 import secrets
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from . import models
+from .cache import get_redis, session_cache, session_cache_key
+from .database import AnySession, run_db
 
 def create_session(db: Session, user_id: int):
     token = secrets.token_urlsafe(32)
@@ -19,18 +22,64 @@ def get_user_id_from_session(db: Session, token: str):
     if not token:
         return None
 
+    now = datetime.now(timezone.utc)
+    user_id = get_cached_user_id(token, now)
+    if user_id:
+        return user_id
+
+    session = find_session(db, token, now)
+    if session:
+        cache_session(token, *session, now)
+        return session[0]
+
+    return None
+
+def find_session(db: Session, token: str, now: datetime):
+    """(user_id, expires_at) живой сессии из базы, без кэша"""
     session = (db.
                query(models.UserSession).
                filter(models.UserSession.session_token==token,
-                     models.UserSession.expires_at > datetime.now(timezone.utc)).
+                     models.UserSession.expires_at > now).
                first()
                )
     if session:
         print("Такая сессия есть!")
-        return session.user_id
+        expires_at = session.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return session.user_id, expires_at
+    return None
 
+def cache_session(token: str, user_id: int, expires_at: datetime, now: datetime):
+    # Запись в кэше не должна пережить саму сессию
+    ttl = min(session_cache.ttl, (expires_at - now).total_seconds())
+    session_cache.set(session_cache_key(token), {"user_id": user_id, "expires_at": expires_at.timestamp()}, ttl=ttl)
+
+def get_cached_user_id(token: str, now: datetime = None):
+    cached = session_cache.get(session_cache_key(token))
+    if cached and cached["expires_at"] > (now or datetime.now(timezone.utc)).timestamp():
+        return cached["user_id"]
     return None
 
+async def get_user_id(db: AnySession, token: str):
+    """Для async-роутеров: при попадании в кэш сессий к базе не обращаемся"""
+    if not token:
+        return None
+    if get_redis() is None:
+        # Без Redis сессии не кэшируются - токен всегда проверяется в базе
+        return await run_db(db, get_user_id_from_session, token)
+
+    # Клиент Redis синхронный: в event loop его не вызываем, в том числе из AsyncSession.run_sync
+    now = datetime.now(timezone.utc)
+    user_id = await run_in_threadpool(get_cached_user_id, token, now)
+    if user_id:
+        return user_id
+    session = await run_db(db, find_session, token, now)
+    if session is None:
+        return None
+    await run_in_threadpool(cache_session, token, *session, now)
+    return session[0]
+
 def delete_session(db: Session, token: str):
     session = (db.
                query(models.UserSession).
@@ -41,4 +90,5 @@ def delete_session(db: Session, token: str):
     if session:
         db.delete(session)
         db.commit()
+    session_cache.delete(session_cache_key(token))
 
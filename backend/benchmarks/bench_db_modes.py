@@ -0,0 +1,93 @@
+"""Нагрузка на запущенный сервер: синхронный путь к базе против async (DB_ASYNC).
+
+Сначала поднимите API в нужном режиме, по одному воркеру на замер:
+    DB_ASYNC=false uvicorn app.main:app --port 8000
+    DB_ASYNC=true  uvicorn app.main:app --port 8000
+
+Затем из папки backend:
+    python -m benchmarks.bench_db_modes [путь ...]
+
+По умолчанию бьет в некэшируемые чтения (поиск и список заказов), чтобы каждый
+запрос доходил до Postgres. Список заказов требует входа: перед замером бенчмарк
+регистрирует (если еще нет) пользователя BENCH_EMAIL/BENCH_PASSWORD, входит и шлет
+cookie сессии во всех запросах. Параметры: BENCH_URL, BENCH_CONCURRENCY (500),
+BENCH_DURATION в секундах (30).
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+
+BASE_URL = os.getenv("BENCH_URL", "http://localhost:8000")
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "500"))
+DURATION = float(os.getenv("BENCH_DURATION", "30"))
+BENCH_EMAIL = os.getenv("BENCH_EMAIL", "bench@example.com")
+BENCH_PASSWORD = os.getenv("BENCH_PASSWORD", "bench-password")
+DEFAULT_PATHS = ["/api/v1/perfumes/search?q=rose", "/api/v1/orders/?limit=20"]
+
+
+async def log_in(session: aiohttp.ClientSession):
+    """Cookie сессии остается в cookie jar клиента и уходит со всеми запросами замера"""
+    user = {"username": BENCH_EMAIL.split("@")[0], "email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+    # 400 - пользователь уже есть, это нормально
+    async with session.post(BASE_URL + "/api/v1/auth/register", json=user) as response:
+        await response.read()
+    async with session.post(BASE_URL + "/api/v1/auth/login",
+                            json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD}) as response:
+        await response.read()
+        if response.status != 200:
+            raise SystemExit(f"Login as {BENCH_EMAIL} failed: HTTP {response.status}")
+
+
+async def worker(session: aiohttp.ClientSession, paths: list, deadline: float, latencies: list, errors: list):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            async with session.get(BASE_URL + path) as response:
+                await response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+                    continue
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(paths: list):
+    latencies, errors = [], []
+    # Лимит соединений клиента не должен быть узким местом замера
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=60)
+    # unsafe=True - cookie принимаются и от http://127.0.0.1
+    cookie_jar = aiohttp.CookieJar(unsafe=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, cookie_jar=cookie_jar) as session:
+        await log_in(session)
+        started = time.perf_counter()
+        deadline = started + DURATION
+        await asyncio.gather(*(worker(session, paths, deadline, latencies, errors) for _ in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{CONCURRENCY} connections, {elapsed:.1f} s, paths: {', '.join(paths)}")
+    print(f"requests   {len(latencies):>10}")
+    print(f"errors     {len(errors):>10}")
+    print(f"rps        {len(latencies) / elapsed:>10.1f}")
+    if latencies:
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f"p50        {quantiles[49]:>10.1f} ms")
+        print(f"p95        {quantiles[94]:>10.1f} ms")
+        print(f"p99        {quantiles[98]:>10.1f} ms")
+
+
+def main():
+    asyncio.run(run(sys.argv[1:] or DEFAULT_PATHS))
+
+
+if __name__ == "__main__":
+    main()
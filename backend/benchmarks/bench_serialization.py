@@ -0,0 +1,77 @@
+"""Сериализация страницы каталога: путь response_model против готового JSON.
+
+Запуск из папки backend:
+    python -m benchmarks.bench_serialization
+
+Сравнивает для страницы из 100 духов:
+  * response_model - ORM-объекты, валидация List[PerfumeResponse] и JSONResponse,
+    как FastAPI делал раньше;
+  * fast path      - строки нужных колонок и orjson (промах кэша);
+  * cache hit      - готовое тело из кэша каталога.
+"""
+import asyncio
+import statistics
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import crud, models, schemas
+from app.cache import catalog_cache
+
+PAGE_SIZE = 100
+REPEAT = 300
+
+
+def seed(db):
+    db.execute(insert(models.Perfume), [
+        {"name": f"Perfume {i}", "brand": f"Brand {i % 20}", "price": 1000 + i,
+         "perfume_type": models.PerfumeType.WOODY, "description": "Древесный аромат " * 10,
+         "img_url": f"/upload/perfumes/{i}.jpg", "stock_quantity": i % 9, "volume": 50,
+         "concentration": "edp"}
+        for i in range(PAGE_SIZE)
+    ])
+    db.commit()
+
+
+def timed(fn) -> float:
+    samples = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    seed(db)
+    field = create_model_field("Response_read_perfumes", List[schemas.PerfumeResponse], mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def response_model_path():
+        perfumes = crud.get_perfumes(db, limit=PAGE_SIZE)
+        content = loop.run_until_complete(serialize_response(field=field, response_content=perfumes))
+        JSONResponse(content).body
+        db.expunge_all()
+
+    def fast_path():
+        catalog_cache.clear()
+        crud.cached_perfumes(db, limit=PAGE_SIZE)["items_json"].encode()
+
+    def cache_hit():
+        crud.cached_perfumes(db, limit=PAGE_SIZE)["items_json"].encode()
+
+    for name, fn in (("response_model", response_model_path), ("fast path", fast_path), ("cache hit", cache_hit)):
+        print(f"{name:<16}{timed(fn):>10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Cart version
+
+Revision ID: a82f4c7e19d3
+Revises: f3b8d6a21c95
+Create Date: 2026-10-18 17:35:12.281904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a82f4c7e19d3'
+down_revision: Union[str, None] = 'f3b8d6a21c95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # С константным DEFAULT Postgres не переписывает таблицу
+    op.add_column('carts', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('carts', 'version')
@@ -0,0 +1,37 @@
+"""Perfume catalog filter indexes
+
+Revision ID: b7e25d0c4f18
+Revises: a4c1e7f2b9d3
+Create Date: 2026-10-18 11:03:47.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e25d0c4f18'
+down_revision: Union[str, None] = 'a4c1e7f2b9d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_perfumes_brand_price', 'perfumes', ['brand', 'price', 'id'], unique=False)
+    op.create_index('ix_perfumes_type_price', 'perfumes', ['perfume_type', 'price', 'id'], unique=False)
+    op.create_index('ix_perfumes_volume_price', 'perfumes', ['volume', 'price', 'id'], unique=False)
+    op.create_index('ix_perfumes_price', 'perfumes', ['price', 'id'], unique=False)
+    op.create_index('ix_perfumes_created_at_id', 'perfumes', ['created_at', 'id'], unique=False)
+    op.create_index('ix_perfumes_in_stock_price', 'perfumes', ['price', 'id'], unique=False,
+                    postgresql_where=sa.text('stock_quantity > 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_perfumes_in_stock_price', table_name='perfumes')
+    op.drop_index('ix_perfumes_created_at_id', table_name='perfumes')
+    op.drop_index('ix_perfumes_price', table_name='perfumes')
+    op.drop_index('ix_perfumes_volume_price', table_name='perfumes')
+    op.drop_index('ix_perfumes_type_price', table_name='perfumes')
+    op.drop_index('ix_perfumes_brand_price', table_name='perfumes')
@@ -0,0 +1,41 @@
+"""Perfume full-text and trigram search
+
+Revision ID: c3f98a1d6e42
+Revises: b7e25d0c4f18
+Create Date: 2026-10-18 12:21:05.734990
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f98a1d6e42'
+down_revision: Union[str, None] = 'b7e25d0c4f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        "ALTER TABLE perfumes ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(brand, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED"
+    )
+    op.create_index('ix_perfumes_search_vector', 'perfumes', ['search_vector'], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_perfumes_name_trgm', 'perfumes', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_perfumes_brand_trgm', 'perfumes', ['brand'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'brand': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_perfumes_brand_trgm', table_name='perfumes')
+    op.drop_index('ix_perfumes_name_trgm', table_name='perfumes')
+    op.drop_index('ix_perfumes_search_vector', table_name='perfumes')
+    op.drop_column('perfumes', 'search_vector')
@@ -0,0 +1,27 @@
+"""User cart version
+
+Revision ID: c6e1a9d42f87
+Revises: b5d0e3f71a26
+Create Date: 2026-10-18 21:04:37.518226
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6e1a9d42f87'
+down_revision: Union[str, None] = 'b5d0e3f71a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # С константным DEFAULT Postgres не переписывает таблицу
+    op.add_column('users', sa.Column('cart_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'cart_version')
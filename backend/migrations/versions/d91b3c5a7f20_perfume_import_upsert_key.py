@@ -0,0 +1,36 @@
+"""Perfume import upsert key
+
+Revision ID: d91b3c5a7f20
+Revises: c3f98a1d6e42
+Create Date: 2026-10-18 13:40:12.551904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd91b3c5a7f20'
+down_revision: Union[str, None] = 'c3f98a1d6e42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Дубли не удаляем автоматически: на духи ссылаются корзины и заказы
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT name, brand, volume, count(*) FROM perfumes "
+        "GROUP BY name, brand, volume HAVING count(*) > 1 LIMIT 20"
+    )).all()
+    if duplicates:
+        raise RuntimeError(
+            "Duplicate perfumes by (name, brand, volume), merge them before upgrading: "
+            + ", ".join(f"{name} / {brand} / {volume} x{count}" for name, brand, volume, count in duplicates)
+        )
+    op.create_unique_constraint('uq_perfumes_name_brand_volume', 'perfumes', ['name', 'brand', 'volume'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_perfumes_name_brand_volume', 'perfumes', type_='unique')
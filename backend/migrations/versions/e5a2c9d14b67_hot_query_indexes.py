@@ -0,0 +1,63 @@
+"""Hot query indexes
+
+Revision ID: e5a2c9d14b67
+Revises: d91b3c5a7f20
+Create Date: 2026-10-18 16:05:47.219384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a2c9d14b67'
+down_revision: Union[str, None] = 'd91b3c5a7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, колонки, уникальный, доп. параметры)
+INDEXES = (
+    ('ix_carts_user_id', 'carts', ['user_id'], False, {}),
+    ('ix_orders_user_id', 'orders', ['user_id'], False, {}),
+    ('ix_orders_status', 'orders', ['status'], False, {'postgresql_include': ['total_amount']}),
+    ('ix_order_items_order_id', 'order_items', ['order_id'], False, {}),
+    ('ix_perfumes_stock_quantity', 'perfumes', ['stock_quantity'], False, {}),
+    ('uq_cart_items_cart_perfume', 'cart_items', ['cart_id', 'perfume_id'], True, {}),
+)
+
+
+def upgrade() -> None:
+    # Повторы одного духа в корзине схлопываем в одну строку с суммарным количеством
+    op.execute(
+        "UPDATE cart_items SET quantity = dup.total "
+        "FROM (SELECT min(id) AS keep_id, sum(quantity) AS total FROM cart_items "
+        "GROUP BY cart_id, perfume_id HAVING count(*) > 1) AS dup "
+        "WHERE cart_items.id = dup.keep_id"
+    )
+    op.execute(
+        "DELETE FROM cart_items USING cart_items AS kept "
+        "WHERE cart_items.cart_id = kept.cart_id AND cart_items.perfume_id = kept.perfume_id "
+        "AND cart_items.id > kept.id"
+    )
+
+    # CONCURRENTLY не блокирует запись, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique, options in INDEXES:
+            # Прерванная сборка оставляет невалидный индекс - пересоздаем его с нуля
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True, **options)
+
+    # Готовый уникальный индекс превращаем в ограничение без повторного построения
+    op.execute(
+        'ALTER TABLE cart_items ADD CONSTRAINT uq_cart_items_cart_perfume '
+        'UNIQUE USING INDEX uq_cart_items_cart_perfume'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_cart_items_cart_perfume', 'cart_items', type_='unique')
+    with op.get_context().autocommit_block():
+        for name, table, _, _, _ in INDEXES[:-1]:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,53 @@
+"""Unique cart per user
+
+Revision ID: f3b8d6a21c95
+Revises: e5a2c9d14b67
+Create Date: 2026-10-18 16:48:03.604127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d6a21c95'
+down_revision: Union[str, None] = 'e5a2c9d14b67'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Для пользователя с несколькими корзинами оставляем самую раннюю
+EXTRA_CARTS = (
+    "SELECT carts.id AS cart_id, keep.cart_id AS keep_id FROM carts "
+    "JOIN (SELECT user_id, min(id) AS cart_id FROM carts GROUP BY user_id HAVING count(*) > 1) AS keep "
+    "ON keep.user_id = carts.user_id AND carts.id <> keep.cart_id"
+)
+
+
+def upgrade() -> None:
+    # Позиции лишних корзин переносим в оставшуюся, складывая количество
+    op.execute(
+        "INSERT INTO cart_items (cart_id, perfume_id, quantity) "
+        "SELECT extra.keep_id, cart_items.perfume_id, sum(cart_items.quantity) "
+        f"FROM cart_items JOIN ({EXTRA_CARTS}) AS extra ON extra.cart_id = cart_items.cart_id "
+        "GROUP BY extra.keep_id, cart_items.perfume_id "
+        "ON CONFLICT ON CONSTRAINT uq_cart_items_cart_perfume "
+        "DO UPDATE SET quantity = cart_items.quantity + excluded.quantity"
+    )
+    op.execute(f"DELETE FROM cart_items WHERE cart_id IN (SELECT cart_id FROM ({EXTRA_CARTS}) AS extra)")
+    op.execute(f"DELETE FROM carts WHERE id IN (SELECT cart_id FROM ({EXTRA_CARTS}) AS extra)")
+
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS uq_carts_user_id')
+        op.create_index('uq_carts_user_id', 'carts', ['user_id'], unique=True, postgresql_concurrently=True)
+        # Уникальный индекс покрывает поиск по user_id - обычный больше не нужен
+        op.drop_index('ix_carts_user_id', table_name='carts', postgresql_concurrently=True)
+
+    op.execute('ALTER TABLE carts ADD CONSTRAINT uq_carts_user_id UNIQUE USING INDEX uq_carts_user_id')
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_carts_user_id', 'carts', type_='unique')
+    with op.get_context().autocommit_block():
+        op.create_index('ix_carts_user_id', 'carts', ['user_id'], unique=False, postgresql_concurrently=True)
@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.cache import catalog_cache, session_cache
+
+
+@pytest.fixture
+def db():
+    """Чистая in-memory база SQLite на каждый тест"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    catalog_cache.clear()
+    session_cache.clear()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
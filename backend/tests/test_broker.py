@@ -0,0 +1,141 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+from aio_pika.pool import Pool
+
+from app.broker import AsyncRabbitMQClient
+
+
+class Exchange:
+    """Вместо канала RabbitMQ: подтверждает сообщения с задержкой и считает неподтвержденные"""
+
+    def __init__(self, reject=()):
+        self.reject = reject
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def publish(self, message, routing_key):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        if message.message_id in self.reject:
+            raise RuntimeError("nack")
+
+
+class Channel:
+    def __init__(self, exchange, declared):
+        self.default_exchange = exchange
+        self.declared = declared
+
+    async def declare_queue(self, queue, durable):
+        self.declared.append(queue)
+        return queue
+
+
+def _client(exchange, declared, **kwargs):
+    client = AsyncRabbitMQClient(**kwargs)
+    opened = []
+
+    async def open_channel():
+        opened.append(Channel(exchange, declared))
+        return opened[-1]
+
+    client.channel = Channel(exchange, declared)
+    client.channels = Pool(open_channel, max_size=kwargs.get("channel_pool_size", 8))
+    return client, opened
+
+
+def test_publish_batch_limits_unconfirmed_messages():
+    async def scenario():
+        exchange = Exchange(reject={"3"})
+        client, _ = _client(exchange, [], max_in_flight=4)
+        confirmed = await client.publish_batch("orders", [{"n": n} for n in range(10)], [str(n) for n in range(10)])
+        return confirmed, exchange.max_in_flight
+
+    confirmed, max_in_flight = asyncio.run(scenario())
+    assert confirmed == [n != 3 for n in range(10)]
+    assert max_in_flight == 4
+
+
+def test_concurrent_publishes_use_separate_channels_and_declare_once():
+    async def scenario():
+        declared = []
+        client, opened = _client(Exchange(), declared, channel_pool_size=3)
+        await client.declare_topology()
+        results = await asyncio.gather(*(client.publish("orders", {"n": n}) for n in range(6)))
+        await client.publish("reports", {"n": 0})
+        await client.publish("reports", {"n": 1})
+        after_connect = list(declared)
+        # После переподключения известные очереди объявляются заново
+        await client._on_reconnect(None)
+        return results, len(opened), after_connect, declared[len(after_connect):]
+
+    results, channels, after_connect, redeclared = asyncio.run(scenario())
+    assert all(results)
+    assert channels == 3
+    assert after_connect == ["notifications", "orders", "reports"]
+    assert redeclared == ["notifications", "orders", "reports"]
+
+
+class FanoutQueue:
+    def __init__(self):
+        self.bound_to = None
+        self.on_message = None
+
+    async def bind(self, exchange):
+        self.bound_to = exchange
+
+    async def consume(self, on_message):
+        self.on_message = on_message
+
+
+class IncomingMessage:
+    def __init__(self, body):
+        self.body = json.dumps(body).encode()
+        self.acked = False
+
+    @asynccontextmanager
+    async def process(self):
+        yield
+        self.acked = True
+
+
+class SubscribeChannel:
+    def __init__(self):
+        self.queue = FanoutQueue()
+        self.exchanges = []
+
+    async def declare_exchange(self, name, exchange_type, durable):
+        self.exchanges.append((name, exchange_type.value))
+        return name
+
+    async def declare_queue(self, exclusive):
+        assert exclusive
+        return self.queue
+
+
+def test_subscribe_binds_own_queue_to_fanout_and_delivers_messages():
+    received = []
+
+    async def callback(message):
+        received.append(message)
+        if message.get("fail"):
+            raise RuntimeError("boom")
+
+    async def scenario():
+        client = AsyncRabbitMQClient()
+        client.channel = SubscribeChannel()
+        assert await client.subscribe("catalog_changes", callback)
+        messages = [IncomingMessage({"type": "stock_changed", "order_id": 1}), IncomingMessage({"fail": True})]
+        for message in messages:
+            await client.channel.queue.on_message(message)
+        return client.channel, messages
+
+    channel, messages = asyncio.run(scenario())
+    assert channel.exchanges == [("catalog_changes", "fanout")]
+    assert channel.queue.bound_to == "catalog_changes"
+    assert received == [{"type": "stock_changed", "order_id": 1}, {"fail": True}]
+    # Ошибка обработчика не оставляет сообщение висеть неподтвержденным
+    assert all(message.acked for message in messages)
@@ -0,0 +1,232 @@
+import fnmatch
+import json
+import time
+
+import redis
+
+from app import cache, crud, models, schemas
+from app.cache import (INVALIDATION_CHANNEL, WORKER_ID, LRUCache, RedisCache, TieredCache, catalog_cache,
+                       session_cache_key)
+from app.query_stats import query_budget
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = LRUCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_load_racing_with_invalidation_is_not_stored():
+    cache = LRUCache(maxsize=10, ttl=60)
+
+    def loader():
+        cache.clear()  # запись в каталог, пока мы читали старые данные
+        return "stale"
+
+    assert cache.get_or_load("a", loader) == "stale"
+    assert cache.get("a") is None
+
+
+def test_shared_only_cache_is_disabled_without_redis():
+    sessions = cache.make_cache("sessions", maxsize=10, ttl=60, shared_only=True)
+    sessions.set(("session", "abc"), {"user_id": 1})
+
+    assert sessions.get(("session", "abc")) is None
+    assert cache.make_cache("catalog", maxsize=10, ttl=60).maxsize == 10
+
+
+def test_create_perfume_invalidates_cached_pages(db):
+    assert crud.cached_perfumes(db)["items_json"] == "[]"
+
+    crud.create_perfume(db, schemas.PerfumeCreate(
+        id=1, name="Rose", brand="Chanel", price=100, perfume_type=models.PerfumeType.FLORAL,
+        concentration="edp"))
+
+    assert [p["name"] for p in json.loads(crud.cached_perfumes(db)["items_json"])] == ["Rose"]
+    assert json.loads(crud.cached_perfume(db, 1)["item_json"])["name"] == "Rose"
+
+
+def make_workers(shared):
+    """Два воркера с общим кэшем; шина инвалидаций - прямой вызов соседа"""
+    workers = {}
+
+    def bus(origin):
+        return lambda message: [w.handle_invalidation(message) for name, w in workers.items() if name != origin]
+
+    for name in ("a", "b"):
+        workers[name] = TieredCache(LRUCache(maxsize=10, ttl=60), shared, "catalog", publish=bus(name))
+    return workers["a"], workers["b"]
+
+
+def test_tiered_cache_shares_values_between_workers():
+    a, b = make_workers(LRUCache(maxsize=10, ttl=60))
+    a.set(("perfume", 1), {"name": "Rose"})
+
+    assert b.get(("perfume", 1)) == {"name": "Rose"}
+
+
+def test_tiered_invalidation_reaches_other_workers():
+    a, b = make_workers(LRUCache(maxsize=10, ttl=60))
+    a.set(("perfume", 1), {"name": "Rose"})
+    b.get(("perfume", 1))  # теперь лежит и в локальном LRU воркера b
+
+    a.clear()
+
+    assert b.get(("perfume", 1)) is None
+
+
+def test_batch_lookup_loads_only_cache_misses_in_one_query(db):
+    for name in ("Rose", "Oud"):
+        db.add(models.Perfume(name=name, brand="Chanel", price=100, perfume_type=models.PerfumeType.FLORAL))
+    db.commit()
+    crud.cached_perfume(db, 1)
+    misses_before = catalog_cache.stats()["misses"]
+
+    # Оба промаха (2 и 99) - одним SELECT ... WHERE id IN (...)
+    with query_budget(db.get_bind(), 1):
+        entries = crud.cached_perfumes_by_ids(db, [2, 99, 1])
+
+    assert list(entries) == [2, 99, 1]
+    assert json.loads(entries[2]["item_json"])["name"] == "Oud"
+    assert entries[99]["item_json"] is None
+    assert catalog_cache.stats()["misses"] - misses_before == 2
+
+
+class FakeRedis:
+    """Вместо redis.Redis: словарь значений, запомненные TTL и опубликованные сообщения"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.data = {}
+        self.ttls = {}
+        self.published = []
+
+    def _check(self):
+        if self.fail:
+            raise redis.ConnectionError("Connection refused")
+
+    def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    def set(self, key, value, px=None):
+        self._check()
+        self.data[key] = value.encode()
+        self.ttls[key] = px
+
+    def unlink(self, *keys):
+        self._check()
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match, count):
+        self._check()
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, match)]
+
+    def publish(self, channel, message):
+        self._check()
+        self.published.append((channel, message))
+
+
+def test_keys_are_namespaced_json():
+    client = FakeRedis()
+    catalog = RedisCache(client, "catalog")
+    catalog.set(("catalog", '{"brands":[]}', "id", 100, None), {"items_json": "[]"})
+
+    assert catalog.redis_key(("perfume", 1)) == 'aromabay:catalog:["perfume",1]'
+    assert list(client.data) == ['aromabay:catalog:["catalog","{\\"brands\\":[]}","id",100,null]']
+
+
+def test_values_round_trip_through_json():
+    client = FakeRedis()
+    sessions, catalog = RedisCache(client, "sessions"), RedisCache(client, "catalog")
+    key = session_cache_key("token-1")
+    page = {"items_json": '[{"name":"Rose"}]', "next_cursor": None, "etag": '"abc"'}
+
+    sessions.set(key, {"user_id": 7, "expires_at": 1700000000.5})
+    catalog.set(("perfumes", 0, 100, None), page)
+
+    # В Redis лежит хэш токена, а не сам токен
+    assert not any("token-1" in redis_key for redis_key in client.data)
+    assert sessions.get(key) == {"user_id": 7, "expires_at": 1700000000.5}
+    assert catalog.get(("perfumes", 0, 100, None)) == page
+    assert catalog.get(("perfumes", 100, 100, None), "missing") == "missing"
+    assert catalog.stats() == {"ttl": 60.0, "hits": 1, "misses": 1, "errors": 0}
+
+
+def test_ttl_is_passed_in_milliseconds():
+    client = FakeRedis()
+    catalog = RedisCache(client, "catalog", ttl=30)
+    catalog.set("default", 1)
+    catalog.set("session", 1, ttl=2.5)
+
+    assert client.ttls == {'aromabay:catalog:"default"': 30000, 'aromabay:catalog:"session"': 2500}
+
+
+def test_redis_errors_behave_like_misses():
+    catalog = RedisCache(FakeRedis(fail=True), "catalog")
+
+    assert catalog.get(("perfume", 1), "missing") == "missing"
+    catalog.set(("perfume", 1), {"name": "Rose"})
+    catalog.delete(("perfume", 1))
+    catalog.clear()
+
+    assert catalog.stats()["errors"] == 4
+    # Общий кэш недоступен - воркер продолжает работать на своем LRU
+    tiered = TieredCache(LRUCache(maxsize=10, ttl=60), catalog, "catalog")
+    tiered.set(("perfume", 1), {"name": "Rose"})
+    assert tiered.get(("perfume", 1)) == {"name": "Rose"}
+
+
+def test_clear_removes_only_own_namespace():
+    client = FakeRedis()
+    catalog, sessions = RedisCache(client, "catalog"), RedisCache(client, "sessions")
+    catalog.set(("perfume", 1), 1)
+    sessions.set(("session", "abc"), 1)
+
+    catalog.clear()
+
+    assert list(client.data) == ['aromabay:sessions:["session","abc"]']
+
+
+def test_invalidation_message_format_and_delivery(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(cache, "get_redis", lambda: client)
+    local = LRUCache(maxsize=10, ttl=60)
+    tiered = TieredCache(local, RedisCache(client, "catalog"), "catalog", publish=cache._publish_invalidation)
+    monkeypatch.setitem(cache._tiered_caches, "catalog", tiered)
+
+    tiered.delete(("perfume", 1))
+    tiered.clear()
+
+    assert [channel for channel, _ in client.published] == [INVALIDATION_CHANNEL] * 2
+    assert [json.loads(message) for _, message in client.published] == [
+        {"namespace": "catalog", "key": ["perfume", 1], "origin": WORKER_ID},
+        {"namespace": "catalog", "key": None, "origin": WORKER_ID},
+    ]
+
+    # Сообщение другого воркера чистит локальный LRU, собственное - игнорируется
+    local.set(("perfume", 1), {"name": "Rose"})
+    local.set(("perfume", 2), {"name": "Oud"})
+    cache._on_invalidation({"data": json.dumps({"namespace": "catalog", "key": ["perfume", 1], "origin": WORKER_ID})})
+    assert local.get(("perfume", 1)) == {"name": "Rose"}
+    cache._on_invalidation({"data": json.dumps({"namespace": "catalog", "key": ["perfume", 1], "origin": "other"})})
+    assert local.get(("perfume", 1)) is None
+    cache._on_invalidation({"data": json.dumps({"namespace": "catalog", "key": None, "origin": "other"})})
+    assert local.get(("perfume", 2)) is None
+    cache._on_invalidation({"data": b"not json"})
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy.orm import sessionmaker
+
+from app import cart_sweeper, crud, models, schemas
+from app.query_stats import query_budget
+
+
+def _seed(db):
+    db.add(models.User(id=1, username="anna", email="anna@example.com", hashed_password="x"))
+    for perfume_id in (1, 2):
+        db.add(models.Perfume(id=perfume_id, name=f"Perfume {perfume_id}", brand="Chanel", price=100,
+                              perfume_type=models.PerfumeType.FLORAL, stock_quantity=5, volume=50))
+    db.commit()
+
+
+def _quantities(cart):
+    return [(item.perfume_id, item.quantity) for item in cart["items"]]
+
+
+def test_repeated_adds_accumulate_in_one_row(db):
+    _seed(db)
+    for quantity in (1, 2):
+        cart = crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=1, quantity=quantity))
+    cart = crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=2, quantity=1))
+
+    assert _quantities(cart) == [(1, 3), (2, 1)]
+    assert db.query(models.Cart).count() == 1
+    assert db.query(models.CartItem).count() == 2
+
+
+def test_cart_mutations_statement_budget(db):
+    _seed(db)
+    # В SQLite нет INSERT в CTE: корзина и позиция - отдельные upsert-ы, плюс чтение ответа
+    with query_budget(db.get_bind(), 3):
+        crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=1, quantity=1))
+    crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=2, quantity=1))
+
+    # Новая версия корзины, сама правка и чтение ответа
+    with query_budget(db.get_bind(), 3):
+        cart = crud.update_perfume_quantity(db, 1, perfume_id=1, quantity=7)
+    assert _quantities(cart) == [(1, 7), (2, 1)]
+
+    with query_budget(db.get_bind(), 3):
+        cart = crud.remove_item_from_cart(db, 1, perfume_id=2)
+    assert _quantities(cart) == [(1, 7)]
+
+
+def test_clearing_keeps_the_cart(db):
+    _seed(db)
+    cart_id = crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=1, quantity=1))["id"]
+    cart = crud.remove_from_cart(db, 1)
+    assert cart == {"id": cart_id, "user_id": 1, "items": [], "version": 2}
+
+
+def test_reading_missing_cart_does_not_write(db):
+    _seed(db)
+    with query_budget(db.get_bind(), 1) as statements:
+        assert crud.get_cart_items(db, 1) == {"id": None, "user_id": 1, "items": [], "version": 0}
+    assert all(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+    crud.remove_item_from_cart(db, 1, perfume_id=1)
+    crud.remove_from_cart(db, 1)
+    assert db.query(models.Cart).count() == 0
+
+
+def _op(op, perfume_id, quantity=1):
+    return schemas.CartOperation(op=op, perfume_id=perfume_id, quantity=quantity)
+
+
+def test_fold_cart_operations():
+    final = crud.fold_cart_operations([
+        _op("add", 1, 2), _op("add", 1, 3),
+        _op("add", 2, 1), _op("remove", 2), _op("add", 2, 4),
+        _op("set", 3, 5), _op("add", 3, 1),
+        _op("add", 4, 1), _op("set", 4, 0),
+    ])
+    assert final == {1: ("add", 5), 2: ("set", 4), 3: ("set", 6), 4: ("set", 0)}
+
+
+def test_patch_applies_batch_in_bulk(db):
+    _seed(db)
+    db.add(models.Perfume(id=3, name="Perfume 3", brand="Dior", price=100,
+                          perfume_type=models.PerfumeType.FLORAL, stock_quantity=5, volume=50))
+    db.commit()
+    crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=1, quantity=2))
+    crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=2, quantity=1))
+
+    operations = [_op("add", 1, 1), _op("remove", 2), _op("set", 3, 4), _op("add", 1, 2)]
+    # Версия, DELETE, по одному upsert на абсолютные значения и на прибавки, чтение ответа
+    with query_budget(db.get_bind(), 5):
+        cart = crud.apply_cart_operations(db, 1, operations)
+    assert _quantities(cart) == [(1, 5), (3, 4)]
+    assert cart["version"] == 3
+
+
+def test_patch_only_removals_does_not_create_cart(db):
+    _seed(db)
+    cart = crud.apply_cart_operations(db, 1, [_op("remove", 1), _op("set", 2, 0)])
+    assert cart == {"id": None, "user_id": 1, "items": [], "version": 0}
+    assert db.query(models.Cart).count() == 0
+
+
+def test_sweeper_deletes_only_old_empty_carts(db, monkeypatch):
+    _seed(db)
+    db.add(models.User(id=2, username="boris", email="boris@example.com", hashed_password="x"))
+    db.add(models.User(id=3, username="vera", email="vera@example.com", hashed_password="x"))
+    db.commit()
+    old = datetime.now(timezone.utc) - timedelta(days=3)
+    # Пустая старая, старая с товаром и свежая пустая
+    db.add_all([models.Cart(id=1, user_id=1, created_at=old), models.Cart(id=2, user_id=2, created_at=old),
+                models.Cart(id=3, user_id=3)])
+    db.add(models.CartItem(cart_id=2, perfume_id=1, quantity=1))
+    db.commit()
+
+    monkeypatch.setattr(cart_sweeper, "CART_SWEEP_BATCH", 1)
+    assert cart_sweeper.sweep_abandoned_carts(sessionmaker(bind=db.get_bind())) == 1
+    assert sorted(cart_id for cart_id, in db.query(models.Cart.id)) == [2, 3]
+
+
+def test_cart_version_keeps_growing_after_sweep(db):
+    _seed(db)
+    old = datetime.now(timezone.utc) - timedelta(days=3)
+    db.add(models.Cart(id=1, user_id=1, created_at=old, version=5))
+    db.commit()
+
+    assert cart_sweeper.sweep_abandoned_carts(sessionmaker(bind=db.get_bind())) == 1
+    assert crud.get_cart_items(db, 1)["version"] == 0
+
+    # Новая корзина не повторяет версии удаленной
+    cart = crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=1))
+    assert cart["version"] == 6
+
+
+def test_checkout_uses_catalog_prices_and_clears_cart(db):
+    _seed(db)
+    crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=1, quantity=2))
+    crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=2, quantity=1))
+    db.query(models.Perfume).filter(models.Perfume.id == 2).update({"price": 250})
+    db.commit()
+
+    # Версия корзины, позиции с ценами, заказ, его позиции, очистка корзины, событие в outbox
+    with query_budget(db.get_bind(), 6):
+        order = crud.checkout_cart(db, 1)
+    assert order["total_amount"] == 450
+    assert [(item["perfume_id"], item["quantity"], item["price"]) for item in order["items"]] == [(1, 2, 100), (2, 1, 250)]
+    assert db.query(models.OrderItem).filter(models.OrderItem.order_id == order["id"]).count() == 2
+    assert crud.get_cart_items(db, 1)["items"] == []
+    assert db.query(models.OutboxEvent).one().payload == order
+    assert crud.checkout_cart(db, 1) is None
+
+
+def test_checkout_ignores_non_positive_lines(db):
+    _seed(db)
+    with pytest.raises(ValidationError):
+        schemas.CartItemCreate(perfume_id=2, quantity=-4)
+    crud.add_to_cart(db, 1, schemas.CartItemCreate(perfume_id=1, quantity=3))
+    # Строка, записанная до проверки количества в схеме
+    db.add(models.CartItem(cart_id=crud.get_cart_items(db, 1)["id"], perfume_id=2, quantity=-4))
+    db.commit()
+
+    order = crud.checkout_cart(db, 1)
+    assert order["total_amount"] == 300
+    assert [(item["perfume_id"], item["quantity"]) for item in order["items"]] == [(1, 3)]
+    assert crud.get_cart_items(db, 1)["items"] == []
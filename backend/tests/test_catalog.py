@@ -0,0 +1,51 @@
+from app import crud, models, schemas
+
+
+def seed(db):
+    rows = [
+        ("Rose", "Chanel", 120.0, models.PerfumeType.FLORAL, 50, 3),
+        ("Oud", "Chanel", 300.0, models.PerfumeType.WOODY, 100, 0),
+        ("Lime", "Dior", 90.0, models.PerfumeType.CITRUS, 50, 5),
+        ("Iris", "Dior", 150.0, models.PerfumeType.FLORAL, 100, 1),
+        ("Sea", "Gucci", 80.0, models.PerfumeType.AQUATIC, 30, 2),
+    ]
+    for name, brand, price, perfume_type, volume, stock in rows:
+        db.add(models.Perfume(name=name, brand=brand, price=price, perfume_type=perfume_type,
+                              volume=volume, stock_quantity=stock))
+    db.commit()
+
+
+def test_catalog_filters_and_sorts(db):
+    seed(db)
+    filters = schemas.CatalogFilters(brands=["Chanel", "Dior"], max_price=200, in_stock=True)
+
+    perfumes = crud.get_catalog(db, filters, sort=schemas.CatalogSort.PRICE_DESC)
+
+    assert [p.name for p in perfumes] == ["Iris", "Rose", "Lime"]
+
+
+def test_catalog_cursor_continues_sorted_page(db):
+    seed(db)
+    filters = schemas.CatalogFilters()
+    sort = schemas.CatalogSort.PRICE_ASC
+
+    first = crud.get_catalog(db, filters, sort=sort, limit=2)
+    rest = crud.get_catalog(db, filters, sort=sort, limit=10, after=crud.catalog_cursor(first[-1], sort))
+
+    assert [p.name for p in first + rest] == ["Sea", "Lime", "Rose", "Iris", "Oud"]
+
+
+def test_facets_ignore_own_dimension(db):
+    seed(db)
+    filters = schemas.CatalogFilters(brands=["Dior"], perfume_types=[models.PerfumeType.FLORAL])
+
+    facets = crud.get_catalog_facets(db, filters)
+
+    assert facets["brands"] == {"Chanel": 1, "Dior": 1}
+    assert facets["perfume_types"] == {"citrus": 1, "floral": 1}
+
+
+def test_search_falls_back_to_ilike_outside_postgres(db):
+    seed(db)
+
+    assert [p.name for p in crud.search_perfumes(db, "dior")] == ["Lime", "Iris"]
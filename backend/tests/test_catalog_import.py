@@ -0,0 +1,75 @@
+import io
+
+from app import catalog_import, models
+from app.catalog_import import CatalogImporter, iter_csv, iter_ndjson
+
+
+def collect(rows):
+    importer = CatalogImporter(db=None)
+    importer.flush = lambda: None  # без базы: проверяем разбор и валидацию
+    for line, row in rows:
+        importer.add(line, row)
+    return importer
+
+
+def test_csv_rows_are_validated_against_perfume_schema():
+    feed = (
+        "name,brand,price,perfume_type,volume,concentration,description\n"
+        "Rose,Chanel,120,floral,50,edp,\n"
+        "Oud,Chanel,abc,woody,100,edp,Дерево\n"
+        "Lime,Dior,90,sour,50,edt,\n"
+    ).encode()
+
+    importer = collect(iter_csv(io.BytesIO(feed)))
+
+    assert importer.report.processed == 3
+    assert [e.line for e in importer.report.errors] == [3, 4]
+    assert "price" in importer.report.errors[0].errors[0]
+    (line, data), = importer.chunk.values()
+    assert line == 2 and data["price"] == 120.0
+    # Пустая ячейка не попадает в строку и не затрет значение в базе
+    assert "description" not in data and "stock_quantity" not in data
+
+
+def test_ndjson_reports_broken_lines_and_dedupes_keys():
+    feed = (
+        b'{"name": "Rose", "brand": "Chanel", "price": 100, "perfume_type": "floral", "volume": 50, "concentration": "edp"}\n'
+        b'\n'
+        b'{not json\n'
+        b'{"name": "Rose", "brand": "Chanel", "price": 110, "perfume_type": "floral", "volume": 50, "concentration": "edp"}\n'
+        b'{"name": "Oud", "brand": "Chanel", "price": 90, "perfume_type": "woody", "concentration": "edp"}\n'
+    )
+
+    importer = collect(iter_ndjson(io.BytesIO(feed)))
+
+    assert [e.line for e in importer.report.errors] == [3, 5]
+    assert "volume" in importer.report.errors[1].errors[0]
+    (line, data), = importer.chunk.values()
+    assert line == 4 and data["price"] == 110
+
+
+def test_error_report_is_bounded(monkeypatch):
+    monkeypatch.setattr(catalog_import, "MAX_REPORTED_ERRORS", 2)
+
+    importer = collect((i, "broken") for i in range(5))
+
+    assert importer.report.failed == 5
+    assert len(importer.report.errors) == 2 and importer.report.errors_truncated
+
+
+def test_partial_feed_keeps_existing_fields(db):
+    db.add(models.Perfume(name="Rose", brand="Chanel", price=100, perfume_type=models.PerfumeType.FLORAL,
+                          description="Роза", stock_quantity=7, volume=50, concentration="edp"))
+    db.commit()
+    feed = (
+        "name,brand,price,perfume_type,volume,concentration,stock_quantity\n"
+        "Rose,Chanel,130,floral,50,edp,\n"
+        "Oud,Chanel,90,woody,100,edp,3\n"
+    ).encode()
+
+    report = catalog_import.import_perfumes(db, io.BytesIO(feed), "csv")
+
+    assert (report.inserted, report.updated, report.failed) == (1, 1, 0)
+    rose, oud = db.query(models.Perfume).order_by(models.Perfume.id).all()
+    assert (rose.price, rose.stock_quantity, rose.description) == (130, 7, "Роза")
+    assert (oud.stock_quantity, oud.volume) == (3, 100)
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import crud, database, models
+from app.database import async_database_url, run_cached, run_db
+
+
+def test_async_database_url_swaps_driver_only():
+    assert async_database_url("postgresql://u:p%40w@db:5432/aromabay") == "postgresql+asyncpg://u:p%40w@db:5432/aromabay"
+    assert async_database_url("postgresql+psycopg2://u:p@db/aromabay") == "postgresql+asyncpg://u:p@db/aromabay"
+    assert async_database_url("sqlite:///local.db") == "sqlite+aiosqlite:///local.db"
+
+
+def test_run_db_calls_crud_with_sync_session(db):
+    db.add(models.Perfume(name="Rose", brand="Chanel", price=120, perfume_type=models.PerfumeType.FLORAL,
+                          stock_quantity=3, volume=50, concentration="edp"))
+    db.commit()
+
+    perfumes = asyncio.run(run_db(db, crud.get_perfumes, limit=10))
+    assert [p.name for p in perfumes] == ["Rose"]
+
+
+def test_run_cached_keeps_redis_calls_off_the_event_loop(monkeypatch):
+    def where(session):
+        return threading.get_ident(), isinstance(session, Session)
+
+    async def scenario():
+        # where() в базу не ходит, поэтому AsyncSession без движка и async-драйвера
+        async with AsyncSession() as session:
+            loop_thread = threading.get_ident()
+            in_memory = await run_cached(session, where)
+            monkeypatch.setattr(database, "get_redis", lambda: object())
+            with_redis = await run_cached(session, where)
+        return loop_thread, in_memory, with_redis
+
+    loop_thread, in_memory, with_redis = asyncio.run(scenario())
+    # Кэш в памяти - AsyncSession.run_sync в потоке event loop
+    assert in_memory == (loop_thread, True)
+    # Redis - в пуле потоков с синхронной сессией
+    assert with_redis[0] != loop_thread and with_redis[1]
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from app import exports, models
+
+
+def seed(db):
+    user = models.User(username="buyer", email="buyer@example.com")
+    perfume = models.Perfume(name="Rose", brand="Chanel", price=100, perfume_type=models.PerfumeType.FLORAL)
+    db.add_all([user, perfume])
+    db.flush()
+    for day, quantities in ((1, [1, 2]), (2, []), (3, [5])):
+        order = models.Order(user_id=user.id, total_amount=sum(quantities) * 100, status="pending",
+                             created_at=datetime(2025, 1, day, 12, 0, 0, 1))
+        order.items = [models.OrderItem(perfume_id=perfume.id, quantity=q, price=100) for q in quantities]
+        db.add(order)
+    db.commit()
+
+
+def export(generator) -> str:
+    return "".join(chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in generator)
+
+
+def test_orders_ndjson_groups_items_across_batches(db, monkeypatch):
+    seed(db)
+    monkeypatch.setattr(exports, "EXPORT_BATCH_SIZE", 1)  # заказ 1 разрезан между пачками
+
+    lines = export(exports.stream_orders(lambda: db, "ndjson")).splitlines()
+
+    orders = [json.loads(line) for line in lines]
+    assert [len(o["items"]) for o in orders] == [2, 0, 1]
+    assert orders[0]["items"][1]["quantity"] == 2
+
+
+def test_orders_csv_respects_time_range(db):
+    seed(db)
+
+    rows = list(csv.reader(io.StringIO(export(exports.stream_orders(
+        lambda: db, "csv", since=datetime(2025, 1, 2), until=datetime(2025, 1, 4))))))
+
+    header = list(exports.ORDER_FIELDS + exports.ORDER_ITEM_FIELDS)
+    assert rows[0] == header
+    assert [row[header.index("quantity")] for row in rows[1:]] == ["", "5"]
+
+
+def test_perfumes_csv_has_header_and_plain_values(db):
+    seed(db)
+
+    rows = list(csv.DictReader(io.StringIO(export(exports.stream_perfumes(lambda: db, "csv")))))
+
+    assert rows[0]["name"] == "Rose" and rows[0]["perfume_type"] == "floral"
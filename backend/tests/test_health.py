@@ -0,0 +1,26 @@
+import asyncio
+
+from app import health
+
+
+def test_health_is_cached_and_reports_pool(monkeypatch):
+    checks = []
+
+    async def broker_down():
+        checks.append("broker")
+        return False
+
+    monkeypatch.setattr(health, "check_broker", broker_down)
+
+    async def scenario():
+        check = health.HealthCheck(ttl=60)
+        # Параллельные пробы ждут одну проверку
+        return await asyncio.gather(*(check.get() for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert checks == ["broker"]
+    assert all(result is results[0] for result in results)
+    assert results[0]["status"] == "degraded"
+    assert results[0]["database"] == "connected"
+    assert results[0]["rabbitmq"] == "disconnected"
+    assert "pool" in results[0]["database_pool"]
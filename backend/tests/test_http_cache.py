@@ -0,0 +1,32 @@
+import json
+
+from app import crud, models, schemas
+from app.http_cache import body_etag, etag_matches
+
+
+def test_body_etag_depends_on_every_part():
+    assert body_etag("[1]", "") == body_etag("[1]", "")
+    assert body_etag("[1]", "") != body_etag("[2]", "")
+    assert body_etag("ab", "c") != body_etag("a", "bc")
+
+
+def test_fast_path_matches_response_model_output(db):
+    db.add(models.Perfume(name="Rose", brand="Chanel", price=120.5, perfume_type=models.PerfumeType.FLORAL,
+                          description="Роза", stock_quantity=3, volume=50, concentration="edp"))
+    db.commit()
+
+    fast = json.loads(crud.cached_perfumes(db)["items_json"])
+    slow = [schemas.PerfumeResponse.model_validate(p).model_dump(mode="json") for p in crud.get_perfumes(db)]
+
+    for item in fast + slow:
+        item.pop("created_at")
+    assert fast == slow
+
+
+def test_if_none_match_parsing():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"zzz", W/"abc"', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"zzz"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,37 @@
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+from app.query_stats import query_budget
+
+
+def test_create_order_inserts_items_in_one_batch(db):
+    db.add(models.User(id=1, username="anna", email="anna@example.com", hashed_password="x"))
+    db.add_all([models.Perfume(id=i, name=f"Perfume {i}", brand="Chanel", price=100,
+                               perfume_type=models.PerfumeType.FLORAL, stock_quantity=5, volume=50)
+                for i in range(1, 51)])
+    db.commit()
+    order = schemas.OrderCreate(items=[schemas.OrderItemCreate(perfume_id=i, quantity=2, price=100)
+                                       for i in range(1, 51)])
+
+    # Как SessionLocal: после commit объекты не перечитываются.
+    # INSERT заказа, один INSERT ... RETURNING на все позиции и событие в outbox
+    session = sessionmaker(bind=db.get_bind(), autoflush=False, expire_on_commit=False)()
+    with query_budget(db.get_bind(), 3):
+        db_order = crud.create_order(session, order, user_id=1)
+        items = [(item.id, item.perfume_id) for item in db_order.items]
+
+    assert db_order.total_amount == 10000
+    assert [perfume_id for _, perfume_id in items] == list(range(1, 51))
+    assert len({item_id for item_id, _ in items}) == 50
+    assert db.query(models.OrderItem).filter(models.OrderItem.order_id == db_order.id).count() == 50
+
+
+def test_get_orders_scoped_to_user(db):
+    db.add_all([models.User(id=1, username="anna", email="anna@example.com", hashed_password="x"),
+                models.User(id=2, username="boris", email="boris@example.com", hashed_password="x")])
+    db.add_all([models.Order(user_id=user_id, status="Created", total_amount=100) for user_id in (1, 2, 1)])
+    db.commit()
+
+    assert {order.user_id for order in crud.get_orders(db, user_id=1)} == {1}
+    assert len(crud.get_orders(db, user_id=1)) == 2
+    assert len(crud.get_orders(db)) == 3
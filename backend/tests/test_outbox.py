@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, models, schemas
+from app.outbox import OutboxDispatcher
+
+
+def _order(db):
+    db.add(models.User(id=1, username="anna", email="anna@example.com", hashed_password="x"))
+    db.add(models.Perfume(id=1, name="Perfume 1", brand="Chanel", price=100,
+                          perfume_type=models.PerfumeType.FLORAL, stock_quantity=5, volume=50))
+    db.commit()
+    order = schemas.OrderCreate(items=[schemas.OrderItemCreate(perfume_id=1, quantity=2, price=100)])
+    return crud.create_order(db, order, user_id=1, contacts={"telegram_username": "anna_tg"})
+
+
+class Broker:
+    """Вместо RabbitMQ: запоминает сообщения, пока не выключен"""
+
+    def __init__(self):
+        self.up = True
+        self.messages = []
+
+    async def publish(self, queue, payloads, message_ids):
+        if not self.up:
+            return [False] * len(payloads)
+        self.messages.extend((queue, payload, message_id) for payload, message_id in zip(payloads, message_ids))
+        return [True] * len(payloads)
+
+
+def test_order_and_event_are_saved_together(db):
+    db_order = _order(db)
+    event = db.query(models.OutboxEvent).one()
+    assert event.queue == "orders"
+    assert event.payload["id"] == db_order.id
+    assert event.payload["telegram_username"] == "anna_tg"
+    assert event.payload["items"][0]["quantity"] == 2
+
+
+def test_dispatcher_retries_until_broker_confirms(db):
+    _order(db)
+    broker = Broker()
+    dispatcher = OutboxDispatcher(broker.publish, sessionmaker(bind=db.get_bind()))
+
+    broker.up = False
+    assert asyncio.run(dispatcher.dispatch_once()) == 1
+    event = db.query(models.OutboxEvent).one()
+    assert event.attempts == 1 and event.last_error
+    event_id = event.id
+    # До конца паузы событие не берется повторно
+    assert asyncio.run(dispatcher.dispatch_once()) == 0
+
+    db.query(models.OutboxEvent).update({"available_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+    db.commit()
+    broker.up = True
+    assert asyncio.run(dispatcher.dispatch_once()) == 1
+    assert [(queue, message_id) for queue, _, message_id in broker.messages] == [("orders", str(event_id))]
+    assert db.query(models.OutboxEvent).count() == 0
+    assert dispatcher.stats()["published"] == 1 and dispatcher.stats()["failed"] == 1
+
+
+def test_outbox_lag(db):
+    assert crud.outbox_lag(db) == {"pending": 0, "lag_seconds": 0.0}
+    db.add(models.OutboxEvent(queue="orders", payload={},
+                              created_at=datetime.now(timezone.utc) - timedelta(minutes=2)))
+    db.commit()
+    lag = crud.outbox_lag(db)
+    assert lag["pending"] == 1 and 119 < lag["lag_seconds"] < 130
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import crud, models, schemas
+from app.pagination import InvalidCursorError, decode_cursor, encode_cursor
+
+
+def make_perfumes(db, count):
+    for i in range(count):
+        db.add(models.Perfume(name=f"Perfume {i}", brand="Brand", price=100 + i,
+                              perfume_type=models.PerfumeType.FRESH))
+    db.commit()
+
+
+def test_cursor_roundtrip():
+    cursor = encode_cursor("orders", datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc), 42)
+    assert decode_cursor(cursor, "orders", 2) == ["2025-01-02T03:04:05+00:00", 42]
+
+
+def test_cursor_rejects_garbage_and_other_lists():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("not a cursor!", "perfumes", 1)
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor("orders", 1), "perfumes", 1)
+
+
+@pytest.mark.parametrize("sort, values", [
+    (schemas.CatalogSort.PRICE_ASC, [[1], {"a": 1}]),
+    (schemas.CatalogSort.PRICE_DESC, ["100", 1]),
+    (schemas.CatalogSort.NAME, [1, 1]),
+    (schemas.CatalogSort.ID, [True]),
+    (schemas.CatalogSort.NEWEST, ["yesterday", 1]),
+])
+def test_catalog_rejects_cursor_values_of_wrong_type(db, sort, values):
+    with pytest.raises(InvalidCursorError):
+        crud.get_catalog(db, schemas.CatalogFilters(), sort=sort,
+                         after=encode_cursor(f"catalog:{sort.value}", *values))
+
+
+def test_perfumes_keyset_matches_offset(db):
+    make_perfumes(db, 25)
+    pages, after = [], None
+    while True:
+        page = crud.get_perfumes(db, limit=10, after=after)
+        pages.extend(p.id for p in page)
+        if len(page) < 10:
+            break
+        after = crud.perfume_cursor(page[-1])
+
+    assert pages == [p.id for p in crud.get_perfumes(db, skip=0, limit=100)]
+
+
+def test_orders_keyset_walks_newest_first(db):
+    user = models.User(username="buyer", email="buyer@example.com")
+    db.add(user)
+    db.flush()
+    start = datetime(2025, 1, 1, 12, 0, 0, 500000)
+    # Два заказа с одинаковым created_at - порядок добивается по id
+    for i, shift in enumerate([0, 1, 1, 2, 3]):
+        db.add(models.Order(user_id=user.id, total_amount=i, created_at=start + timedelta(seconds=shift)))
+    db.commit()
+
+    first = crud.get_orders(db, limit=2)
+    second = crud.get_orders(db, limit=2, after=crud.order_cursor(first[-1]))
+    third = crud.get_orders(db, limit=2, after=crud.order_cursor(second[-1]))
+
+    walked = [o.id for o in first + second + third]
+    assert walked == [o.id for o in crud.get_orders(db, limit=10)]
+    assert len(set(walked)) == 5
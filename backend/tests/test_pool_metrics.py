@@ -0,0 +1,60 @@
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool
+
+from app.pool_metrics import PoolMetrics, instrumented_pool_class, pool_stats
+
+
+def test_pool_records_waits_and_timeouts(tmp_path):
+    metrics = PoolMetrics()
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=instrumented_pool_class(QueuePool, metrics),
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    with engine.connect():
+        stats = pool_stats(engine.pool)
+        assert stats["checked_out"] == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    # dispose() пересоздает пул - метрики должны остаться
+    engine.dispose()
+    with engine.connect():
+        pass
+
+    stats = pool_stats(engine.pool)
+    assert stats["checkouts"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["checked_out"] == 0
+    assert sum(stats["wait_histogram"].values()) == 2
+
+
+def test_wait_histogram_buckets():
+    metrics = PoolMetrics()
+    for wait_ms in (0.5, 7, 7, 100000):
+        metrics.record_wait(wait_ms)
+    histogram = metrics.stats()["wait_histogram"]
+    assert histogram["le_1ms"] == 1
+    assert histogram["le_10ms"] == 2
+    assert histogram["inf"] == 1
+    assert metrics.stats()["wait_max_ms"] == 100000
+
+
+def test_new_connections_are_not_counted_as_waiting(tmp_path):
+    def slow_connect():
+        time.sleep(0.1)
+        return sqlite3.connect(tmp_path / "pool.db")
+
+    metrics = PoolMetrics()
+    engine = create_engine("sqlite://", creator=slow_connect, poolclass=instrumented_pool_class(QueuePool, metrics),
+                           pool_size=1, max_overflow=0)
+    for _ in range(2):
+        with engine.connect():
+            pass
+
+    stats = pool_stats(engine.pool)
+    assert stats["checkouts"] == 2
+    assert stats["connects"] == 1
+    assert stats["connect_max_ms"] >= 100
+    assert stats["wait_max_ms"] < 50
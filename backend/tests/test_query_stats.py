@@ -0,0 +1,77 @@
+import asyncio
+
+from sqlalchemy import text
+
+from app import crud, models, schemas, session_manager
+from app.cache import LRUCache, TieredCache
+from app.query_stats import QueryStatsMiddleware, instrument_engine, query_budget
+from app.session_manager import create_session, get_user_id_from_session
+
+
+def _seed_orders(db, count):
+    user = models.User(username="anna", email="anna@example.com", hashed_password="x")
+    db.add(user)
+    db.add(models.Perfume(id=1, name="Rose", brand="Chanel", price=100, perfume_type=models.PerfumeType.FLORAL,
+                          stock_quantity=5, volume=50, concentration="edp"))
+    db.commit()
+    for _ in range(count):
+        crud.create_order(db, schemas.OrderCreate(items=[schemas.OrderItemCreate(perfume_id=1, quantity=1, price=100)]),
+                          user_id=user.id)
+    user_id = user.id
+    db.expunge_all()
+    return user_id
+
+
+def test_orders_list_does_not_grow_with_page_size(db):
+    _seed_orders(db, 5)
+    # Заказы с пользователем одним запросом и все позиции вторым
+    with query_budget(db.get_bind(), 2):
+        orders = crud.get_orders(db, limit=5)
+        assert all(order.items and order.user for order in orders)
+
+
+def test_cart_and_session_lookup_budget(db):
+    user_id = _seed_orders(db, 0)
+    token = create_session(db, user_id)
+    crud.add_to_cart(db, user_id, schemas.CartItemCreate(perfume_id=1, quantity=1))
+    db.expunge_all()
+
+    with query_budget(db.get_bind(), 2):
+        assert crud.get_cart_items(db, user_id)["items"]
+    # Без Redis сессии не кэшируются: каждая проверка - один запрос
+    get_user_id_from_session(db, token)
+    with query_budget(db.get_bind(), 1):
+        assert get_user_id_from_session(db, token) == user_id
+
+
+def test_repeated_session_lookup_served_from_shared_cache(db, monkeypatch):
+    user_id = _seed_orders(db, 0)
+    token = create_session(db, user_id)
+    shared = TieredCache(LRUCache(maxsize=10, ttl=60), LRUCache(maxsize=10, ttl=60), "sessions")
+    monkeypatch.setattr(session_manager, "session_cache", shared)
+
+    get_user_id_from_session(db, token)
+    with query_budget(db.get_bind(), 0):
+        assert get_user_id_from_session(db, token) == user_id
+
+
+def test_middleware_reports_queries_in_server_timing(db):
+    engine = db.get_bind()
+    instrument_engine(engine)
+
+    async def app(scope, receive, send):
+        with engine.connect() as connection:
+            for _ in range(3):
+                connection.execute(text("SELECT 1"))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/"}
+    asyncio.run(QueryStatsMiddleware(app)(scope, None, send))
+    headers = dict(sent[0]["headers"])
+    assert b'desc="3 queries"' in headers[b"server-timing"]
@@ -0,0 +1,36 @@
+from sqlalchemy import text
+
+from app import database
+from app.database import ReplicaPool
+
+
+def _replica_url(tmp_path, name):
+    # Отдельный файл SQLite вместо второго сервера Postgres
+    return f"sqlite:///{tmp_path / name}"
+
+
+def test_replicas_are_picked_round_robin(tmp_path):
+    pool = ReplicaPool([_replica_url(tmp_path, "a.db"), _replica_url(tmp_path, "b.db")], use_async=False)
+    picked = [pool.pick().name for _ in range(4)]
+    assert picked[0] != picked[1]
+    assert picked[:2] == picked[2:]
+
+
+def test_unreachable_replica_is_skipped(tmp_path):
+    pool = ReplicaPool(["sqlite:////nonexistent-dir/down.db", _replica_url(tmp_path, "up.db")], use_async=False)
+    assert {pool.pick().name for _ in range(4)} == {pool.replicas[1].name}
+    assert pool.replicas[0].healthy is False
+
+
+def test_reads_go_to_primary_without_replicas_and_after_writes(tmp_path, monkeypatch):
+    assert ReplicaPool([], use_async=False).pick() is None
+
+    pool = ReplicaPool([_replica_url(tmp_path, "a.db")], use_async=False)
+    pool.note_write()
+    assert pool.pick() is None
+
+    monkeypatch.setattr(database, "replica_pool", ReplicaPool([_replica_url(tmp_path, "c.db")], use_async=False))
+    dependency = database.get_read_db()
+    db = next(dependency)
+    assert db.execute(text("PRAGMA database_list")).fetchone()[2].endswith("c.db")
+    dependency.close()
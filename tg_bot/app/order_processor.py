@@ -3,18 +3,27 @@ import json
 import asyncpg
 import os
 
+# Статусы необработанного заказа: "Created" ставит backend, "pending" - значение по умолчанию в модели
+NEW_ORDER_STATUSES = ("Created", "pending")
+# Fanout exchange, по которому каждый воркер backend сбрасывает кэш каталога (backend/app/broker.py)
+CATALOG_CHANGES_EXCHANGE = "catalog_changes"
+
 class OrderProcessor:
     def __init__(self):
         self.rabbitmq_url = os.getenv("RABBITMQ_URL")
         self.database_url = os.getenv("DATABASE_URL")
         self.connection = None
         self.channel = None
+        self.catalog_exchange = None
 
     async def connect(self):
         """Подключение к RabbitMQ"""
         try:
             self.connection = await aio_pika.connect_robust(self.rabbitmq_url, reconnect_interval=5)
             self.channel = await self.connection.channel()
+            self.catalog_exchange = await self.channel.declare_exchange(
+                CATALOG_CHANGES_EXCHANGE, aio_pika.ExchangeType.FANOUT, durable=True
+            )
             print("OrderProcessor connected to RabbitMQ")
             return True
         except Exception as e:
@@ -34,29 +43,65 @@ class OrderProcessor:
         except Exception as e:
             print(f"Failed to send notification: {e}")
 
+    async def send_catalog_change(self, order_id: int):
+        """Остатки изменились мимо API: backend сбросит кэш каталога, не дожидаясь TTL"""
+        try:
+            await self.catalog_exchange.publish(
+                aio_pika.Message(body=json.dumps({"type": "stock_changed", "order_id": order_id}).encode()),
+                routing_key=""
+            )
+        except Exception as e:
+            print(f"Failed to send catalog change: {e}")
+
     async def process_order(self, order_data: dict):
-        """Обработка одного заказа"""
+        """Обработка одного заказа.
+
+        Backend публикует заказы из outbox с доставкой "хотя бы один раз", поэтому
+        одно сообщение может прийти повторно. Заказ блокируется и обрабатывается
+        только пока у него начальный статус - повтор не спишет остатки второй раз.
+        """
         print(f"Processing order: {order_data}")
 
         conn = await asyncpg.connect(self.database_url)
         try:
-            order_id = order_data.get("id")
-            print(order_id)
-            print(type(order_id))
-            # Получаем заказ из БД
+            notification = await self.apply_order(conn, order_data)
+        except Exception as e:
+            print(f"Error processing order: {e}")
+            return
+        finally:
+            await conn.close()
+
+        # Сообщения только после commit и только для впервые обработанного заказа
+        if notification:
+            if notification["status"] == "confirmed":
+                await self.send_catalog_change(notification["order_id"])
+            await self.send_notification(notification)
+
+    async def apply_order(self, conn, order_data: dict):
+        """Проверка остатков, списание и смена статуса одной транзакцией.
+
+        Возвращает уведомление или None, если заказ уже обработан.
+        """
+        order_id = order_data.get("id")
+        async with conn.transaction():
+            # Строка заказа заблокирована до commit: параллельный повтор дождется и увидит новый статус
             order = await conn.fetchrow(
-                "SELECT * FROM orders WHERE id = $1", order_id
+                "SELECT * FROM orders WHERE id = $1 FOR UPDATE", order_id
             )
             if not order:
                 print(f"❌ Order {order_id} not found")
-                return
+                return None
+            if order['status'] not in NEW_ORDER_STATUSES:
+                print(f"⚠️ Order {order_id} already processed ({order['status']}), skipping duplicate")
+                return None
 
-            # Получаем товары заказа
+            # Получаем товары заказа; остатки блокируем, чтобы проверка и списание не разошлись
             order_items = await conn.fetch(
                 "SELECT oi.*, p.name as perfume_name, p.stock_quantity "
                 "FROM order_items oi "
                 "JOIN perfumes p ON p.id = oi.perfume_id "
-                "WHERE oi.order_id = $1", order_id
+                "WHERE oi.order_id = $1 "
+                "FOR UPDATE OF p", order_id
             )
 
             # Проверяем наличие товаров
@@ -67,7 +112,6 @@ class OrderProcessor:
                     print(f"❌ Not enough stock for {item['perfume_name']}")
                     break
 
-            # Обновляем статус заказа
             if all_in_stock:
                 # Резервируем товары
                 for item in order_items:
@@ -75,44 +119,26 @@ class OrderProcessor:
                         "UPDATE perfumes SET stock_quantity = stock_quantity - $1 WHERE id = $2",
                         item['quantity'], item['perfume_id']
                     )
-
-                await conn.execute(
-                    "UPDATE orders SET status = 'confirmed' WHERE id = $1",
-                    order_id
-                )
-                print(f"✅ Order {order_id} confirmed")
-
-                # Отправляем уведомление о подтверждении
-                await self.send_notification({
-                    "type": "order_processed",
-                    "order_id": order_id,
-                    "status": order['status'],
-                    "user_email": order_data['user_email'],
-                    "telegram_username": order_data['telegram_username'],
-                    "total_amount": order['total_amount']
-                })
-
+                status = "confirmed"
             else:
-                await conn.execute(
-                    "UPDATE orders SET status = 'cancelled' WHERE id = $1",
-                    order_id
-                )
-                print(f"Order {order_id} cancelled due to insufficient stock")
-
-                # Отправляем уведомление об отмене
-                await self.send_notification({
-                    "type": "order_processed",
-                    "order_id": order_id,
-                    "status": "cancelled",
-                    "user_email": order['user_email'],
-                    "telegram_username": order['telegram_username'],
-                    "total_amount": order['total_amount']
-                })
+                status = "cancelled"
+            await conn.execute(
+                "UPDATE orders SET status = $2 WHERE id = $1",
+                order_id, status
+            )
 
-        except Exception as e:
-            print(f"Error processing order: {e}")
-        finally:
-            await conn.close()
+        if status == "confirmed":
+            print(f"✅ Order {order_id} confirmed")
+        else:
+            print(f"Order {order_id} cancelled due to insufficient stock")
+        return {
+            "type": "order_processed",
+            "order_id": order_id,
+            "status": status,
+            "user_email": order_data.get('user_email'),
+            "telegram_username": order_data.get('telegram_username'),
+            "total_amount": order['total_amount']
+        }
 
     async def start_consuming(self):
         """Запуск обработки заказов"""
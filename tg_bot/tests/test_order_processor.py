@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import asyncio
+from contextlib import asynccontextmanager
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app import order_processor
+from app.order_processor import OrderProcessor
+
+
+class FakeConnection:
+    """Минимум asyncpg.Connection для обработки одного заказа"""
+
+    def __init__(self, status, stock):
+        self.order = {"id": 1, "status": status, "total_amount": 300}
+        self.stock = stock
+        self.items = [{"perfume_id": 7, "perfume_name": "Perfume 7", "quantity": 2}]
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetchrow(self, query, order_id):
+        return dict(self.order)
+
+    async def fetch(self, query, order_id):
+        return [{**item, "stock_quantity": self.stock} for item in self.items]
+
+    async def close(self):
+        pass
+
+    async def execute(self, query, *args):
+        if query.startswith("UPDATE perfumes"):
+            self.stock -= args[0]
+        elif query.startswith("UPDATE orders"):
+            self.order["status"] = args[1]
+
+
+def test_duplicate_delivery_does_not_decrement_stock_twice():
+    conn = FakeConnection("Created", stock=5)
+    processor = OrderProcessor()
+    order_data = {"id": 1, "user_email": "anna@example.com", "telegram_username": "anna"}
+
+    first = asyncio.run(processor.apply_order(conn, order_data))
+    second = asyncio.run(processor.apply_order(conn, order_data))
+
+    assert first["status"] == "confirmed"
+    assert second is None
+    assert conn.stock == 3
+    assert conn.order["status"] == "confirmed"
+
+
+def test_insufficient_stock_cancels_without_decrement():
+    conn = FakeConnection("Created", stock=1)
+    notification = asyncio.run(OrderProcessor().apply_order(conn, {"id": 1}))
+    assert notification["status"] == "cancelled"
+    assert conn.stock == 1
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, json.loads(message.body)))
+
+
+def test_confirmed_order_announces_stock_change_once(monkeypatch):
+    conn = FakeConnection("Created", stock=5)
+
+    async def connect(url):
+        return conn
+
+    monkeypatch.setattr(order_processor.asyncpg, "connect", connect)
+    processor = OrderProcessor()
+    processor.catalog_exchange, notifications = FakeExchange(), FakeExchange()
+    processor.channel = type("Channel", (), {"default_exchange": notifications})()
+
+    # Повторная доставка того же заказа ничего не меняет и ничего не публикует
+    for _ in range(2):
+        asyncio.run(processor.process_order({"id": 1}))
+
+    assert processor.catalog_exchange.published == [("", {"type": "stock_changed", "order_id": 1})]
+    assert [body["status"] for _, body in notifications.published] == ["confirmed"]